@@ -17,6 +17,10 @@ class MovieAdmin(admin.ModelAdmin):
     search_fields = ["title"]
     list_filter = ("genres", "release_year")
 
+    def get_queryset(self, request):
+        # жанры всей страницы списка — одним запросом, а не по запросу на строку
+        return super().get_queryset(request).prefetch_related('genres')
+
     def get_genres(self, obj):
         """Показывает все жанры фильма через запятую в списке фильмов"""
         return ", ".join([g.name for g in obj.genres.all()])
@@ -33,14 +37,15 @@ class HallAdmin(admin.ModelAdmin):
 class SeatInline(admin.TabularInline):
     model = Seat
     extra = 0
-    fields = ("row", "column", "is_reserved", "viewer")
+    fields = ("row", "column", "viewer")
     ordering = ("row", "column")
 
 
 @admin.register(Session)
 class SessionAdmin(admin.ModelAdmin):
-    list_display = ("movie", "hall", "datetime")
+    list_display = ("movie", "hall", "datetime", "seats_sold", "seats_total")
     list_filter = ("hall", "movie", "datetime")
+    readonly_fields = ("seats_sold", "seats_total")
     search_fields = ("movie__title",)
     inlines = [SeatInline]
 
@@ -64,8 +69,8 @@ class ViewerAdmin(admin.ModelAdmin):
 
 @admin.register(Seat)
 class SeatAdmin(admin.ModelAdmin):
-    list_display = ("session", "row", "column", "is_reserved", "viewer")
-    list_filter = ("session", "is_reserved")
+    list_display = ("session", "row", "column", "viewer")
+    list_filter = ("session",)
     search_fields = ("viewer__first_name", "viewer__email")
 
 
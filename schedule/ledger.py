@@ -0,0 +1,106 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PromoCode, Transaction, Wallet
+
+
+# ===== 💳 Гаманець: зміни балансу =====
+# Баланс змінюється лише тут і лише виразом у SQL:
+# UPDATE balance = balance ± сума — без читання в Python і запису назад,
+# тож паралельні запити не гублять ні поповнень, ні списань. Списання
+# умовне (WHERE balance >= сума): якщо грошей не вистачає, не змінюється
+# жоден рядок. Запис в історії (Transaction) створюється в тій самій
+# транзакції БД, що й зміна балансу.
+#
+# Об'єкт wallet у пам'яті не оновлюється — після операції актуальний
+# баланс є лише в БД (refresh_from_db, якщо він потрібен одразу).
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def _amount(amount):
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValueError("Сума має бути додатною")
+    return amount
+
+
+def credit(wallet, amount, type='deposit', description=None, items=None):
+    """Зараховує amount на гаманець і пише запис в історію; повертає Transaction."""
+    amount = _amount(amount)
+    # savepoint=False: у складі більшої транзакції (продаж) — без зайвих SAVEPOINT
+    with transaction.atomic(savepoint=False):
+        Wallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + amount, updated_at=timezone.now())
+        return Transaction.objects.create(
+            wallet=wallet, type=type, amount=amount, description=description, items=items or []
+        )
+
+
+def debit(wallet, amount, description=None, items=None):
+    """
+    Списує amount, лише якщо його вистачає на балансі, і пише запис в
+    історію; повертає Transaction. InsufficientFunds — нічого не змінено.
+    """
+    amount = _amount(amount)
+    with transaction.atomic(savepoint=False):
+        debited = Wallet.objects.filter(pk=wallet.pk, balance__gte=amount).update(
+            balance=F('balance') - amount, updated_at=timezone.now()
+        )
+        if not debited:
+            raise InsufficientFunds()
+        return Transaction.objects.create(
+            wallet=wallet, type='spend', amount=amount, description=description, items=items or []
+        )
+
+
+# ===== 🎁 Промокоди =====
+# Активація — одна транзакція з трьох кроків без читання лічильників у
+# Python: рядок у used_by (унікальна пара промокод–глядач не дасть
+# активувати двічі), умовний UPDATE used_count = used_count + 1 WHERE
+# used_count < max_uses AND is_active AND не прострочений (ліміт не
+# перевищить навіть під напливом), і зарахування через credit. Якщо
+# будь-який крок не проходить — відкочується все.
+
+
+class PromoRejected(Exception):
+    """Промокод не можна активувати; текст — причина для глядача."""
+
+
+def redeem_promo(wallet, code):
+    """Активує промокод для власника гаманця; повертає PromoCode."""
+    promo = PromoCode.objects.filter(code__iexact=code).only('code', 'amount').first()
+    if promo is None:
+        raise PromoRejected("Такого промокоду не існує.")
+
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            PromoCode.used_by.through.objects.create(promocode_id=promo.pk, viewer_id=wallet.viewer_id)
+        except IntegrityError:
+            # лише цей INSERT означає повторну активацію; помилки зарахування
+            # нижче летять як є. Окремий SAVEPOINT не потрібен: PromoRejected
+            # одразу виходить з atomic, і той відкочує транзакцію
+            raise PromoRejected("Ви вже використали цей промокод.")
+        claimed = PromoCode.objects.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+            pk=promo.pk, is_active=True, used_count__lt=F('max_uses'),
+        ).update(used_count=F('used_count') + 1)
+        if not claimed:
+            raise PromoRejected(_rejection_reason(promo.pk, now))
+        credit(wallet, promo.amount, 'promo', f"Поповнення промокодом {promo.code}")
+    return promo
+
+
+def _rejection_reason(promo_id, now):
+    # лише для повідомлення, на рішення вже не впливає
+    promo = PromoCode.objects.get(pk=promo_id)
+    if not promo.is_active:
+        return "Промокод неактивний."
+    if promo.expires_at and now > promo.expires_at:
+        return "Строк дії промокоду вичерпано."
+    return "Ліміт активацій промокоду вичерпано."
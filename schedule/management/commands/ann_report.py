@@ -0,0 +1,100 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from scipy import sparse
+
+from schedule.ann import LSHIndex
+
+
+def synthetic_tfidf(n_docs, vocabulary=5000, words_per_doc=20, topic_size=25, seed=0):
+    """
+    Синтетичний TF-IDF: кожен «фільм» бере більшість слів зі своєї теми,
+    тож справжні сусіди існують і recall має сенс.
+    """
+    rng = np.random.default_rng(seed)
+    n_topics = max(n_docs // 50, 1)
+    topics = rng.integers(0, vocabulary, size=(n_topics, topic_size))
+    doc_topics = rng.integers(0, n_topics, size=n_docs)
+
+    topical = words_per_doc * 4 // 5
+    picks = rng.integers(0, topic_size, size=(n_docs, topical))
+    cols = np.hstack([
+        topics[doc_topics[:, None], picks],
+        rng.integers(0, vocabulary, size=(n_docs, words_per_doc - topical)),
+    ])
+    rows = np.repeat(np.arange(n_docs), words_per_doc)
+    matrix = sparse.csr_matrix(
+        (np.ones(rows.size, dtype=np.float32), (rows, cols.ravel())),
+        shape=(n_docs, vocabulary),
+    )
+    matrix.sum_duplicates()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return (sparse.diags(1.0 / norms) @ matrix).tocsr()
+
+
+class Command(BaseCommand):
+    help = "Звіт recall@K / латентність: точна косинусна схожість проти LSH на синтетичних каталогах"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--tables', type=int, nargs='+', default=[8, 16, 24])
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('-k', type=int, default=10)
+        parser.add_argument('--output', default=None, help="Зберегти результати у JSON")
+
+    def handle(self, *args, **options):
+        k = options['k']
+        results = []
+        self.stdout.write(
+            f"{'movies':>9} {'tables':>6} {'build, s':>9} {'exact, ms':>10} "
+            f"{'ann, ms':>8} {'candidates':>10} {'recall@' + str(k):>10}"
+        )
+
+        for n in options['sizes']:
+            matrix = synthetic_tfidf(n)
+            queries = np.random.default_rng(1).choice(n, size=min(options['queries'], n), replace=False)
+
+            # точний пошук: косинус запиту з усім каталогом
+            truth = {}
+            started = time.perf_counter()
+            for row in queries:
+                sims = np.asarray((matrix @ matrix[row].T).todense()).ravel()
+                sims[row] = -1
+                truth[row] = np.argpartition(-sims, k)[:k]
+            exact_ms = (time.perf_counter() - started) / len(queries) * 1000
+
+            for tables in options['tables']:
+                started = time.perf_counter()
+                index = LSHIndex(matrix, n_tables=tables)
+                build = time.perf_counter() - started
+
+                hits, candidates = 0, 0
+                started = time.perf_counter()
+                for row in queries:
+                    found, _ = index.neighbours(row, k)
+                    hits += len(np.intersect1d(truth[row], found))
+                ann_ms = (time.perf_counter() - started) / len(queries) * 1000
+                for row in queries:
+                    candidates += len(index.candidates(matrix[row]))
+
+                result = {
+                    "movies": n,
+                    "tables": tables,
+                    "bits": index.n_bits,
+                    "build_seconds": round(build, 3),
+                    "exact_ms": round(exact_ms, 3),
+                    "ann_ms": round(ann_ms, 3),
+                    "candidates": round(candidates / len(queries), 1),
+                    "recall": round(hits / (k * len(queries)), 4),
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"{n:>9} {tables:>6} {result['build_seconds']:>9} {result['exact_ms']:>10} "
+                    f"{result['ann_ms']:>8} {result['candidates']:>10} {result['recall']:>10}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({"k": k, "results": results}, fh, indent=2)
@@ -0,0 +1,169 @@
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from schedule.models import Genre, Movie, MovieActivity, Rating, Viewer
+from schedule import recommendations
+
+WORDS = (
+    "space robot alien war love family city night police detective hero villain "
+    "magic school dragon ship ocean island murder secret agent spy future past "
+    "time travel ghost house forest king queen army revenge friendship money heist "
+    "race car music dance dream prison escape virus zombie planet storm winter summer"
+).split()
+
+
+def seed_catalog(movies, viewers, ratings, activities, genres=20, seed=0):
+    """Заповнює БД синтетичними жанрами, фільмами, глядачами, оцінками та активністю."""
+    rng = np.random.default_rng(seed)
+
+    Genre.objects.bulk_create([Genre(name=f"Genre {i}") for i in range(genres)])
+    genre_ids = list(Genre.objects.values_list('id', flat=True))
+
+    Movie.objects.bulk_create([
+        Movie(
+            title=f"Movie {i}",
+            release_year=int(rng.integers(1970, 2026)),
+            short_description=" ".join(rng.choice(WORDS, size=8)),
+            full_description=" ".join(rng.choice(WORDS, size=40)),
+        )
+        for i in range(movies)
+    ], batch_size=2000)
+    movie_ids = np.array(Movie.objects.values_list('id', flat=True))
+
+    through = Movie.genres.through
+    through.objects.bulk_create([
+        through(movie_id=int(movie_id), genre_id=int(genre_id))
+        for movie_id in movie_ids
+        for genre_id in rng.choice(genre_ids, size=int(rng.integers(1, 4)), replace=False)
+    ], batch_size=5000)
+
+    Viewer.objects.bulk_create([Viewer(first_name=f"Viewer {i}") for i in range(viewers)], batch_size=2000)
+    viewer_ids = np.array(Viewer.objects.values_list('id', flat=True))
+
+    def unique_pairs(count):
+        # случайные уникальные пары (зритель, фильм)
+        count = min(count, len(viewer_ids) * len(movie_ids))
+        flat = rng.choice(len(viewer_ids) * len(movie_ids), size=count, replace=False)
+        return viewer_ids[flat // len(movie_ids)], movie_ids[flat % len(movie_ids)]
+
+    v, m = unique_pairs(ratings)
+    Rating.objects.bulk_create([
+        Rating(viewer_id=int(a), movie_id=int(b), score=int(s))
+        for a, b, s in zip(v, m, rng.integers(1, 11, size=len(v)))
+    ], batch_size=5000)
+
+    v, m = unique_pairs(activities)
+    MovieActivity.objects.bulk_create([
+        MovieActivity(
+            viewer_id=int(a), movie_id=int(b),
+            time_spent=float(t), watched_trailer=bool(tr), watched_movie=bool(wm),
+        )
+        for a, b, t, tr, wm in zip(
+            v, m,
+            rng.uniform(0, 600, size=len(v)),
+            rng.random(len(v)) < 0.3,
+            rng.random(len(v)) < 0.1,
+        )
+    ], batch_size=5000)
+
+    return list(viewer_ids)
+
+
+def reset_caches():
+    recommendations._tfidf_cache.update({key: None for key in recommendations._tfidf_cache})
+    recommendations._cf_cache.update({key: None for key in recommendations._cf_cache})
+    for alias in ('default', 'recommendations'):
+        caches[alias].clear()
+
+
+def measure(fn):
+    """Час, кількість SQL-запитів і пік пам'яті Python/NumPy одного виклику."""
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": round(elapsed, 4),
+        "queries": len(queries),
+        "peak_mb": round(peak / 2 ** 20, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк hybrid_recommendations на синтетичних даних в окремій тестовій БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=1000)
+        parser.add_argument('--viewers', type=int, default=1000)
+        parser.add_argument('--ratings', type=int, default=10_000)
+        parser.add_argument('--activities', type=int, default=10_000)
+        parser.add_argument('--genres', type=int, default=20)
+        parser.add_argument('--samples', type=int, default=20, help="Скільки глядачів у теплому прогоні")
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--output', default=os.path.join(tempfile.gettempdir(), 'bench_output.json'),
+            help="Куди записати JSON-звіт (за замовчуванням — тимчасовий каталог, не робоче дерево)",
+        )
+
+    def handle(self, *args, **options):
+        # окрема тестова БД, щоб не зачепити реальні дані
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Результати збережено в {options['output']}"))
+
+    def _run(self, options):
+        limit = options['limit']
+        started = time.perf_counter()
+        viewer_ids = seed_catalog(
+            options['movies'], options['viewers'], options['ratings'],
+            options['activities'], options['genres'],
+        )
+        seed_seconds = time.perf_counter() - started
+
+        rng = np.random.default_rng(1)
+        sample = [int(v) for v in rng.choice(viewer_ids, size=min(options['samples'], len(viewer_ids)), replace=False)]
+
+        reset_caches()
+        cold = measure(lambda: recommendations.hybrid_recommendations(sample[0], limit=limit))
+
+        warm_runs = [
+            measure(lambda viewer_id=viewer_id: recommendations.hybrid_recommendations(viewer_id, limit=limit))
+            for viewer_id in sample
+        ]
+        seconds = np.array([run["seconds"] for run in warm_runs])
+
+        return {
+            "scale": {key: options[key] for key in ('movies', 'viewers', 'ratings', 'activities', 'genres')},
+            "mode": recommendations.similarity_mode(),
+            "seed_seconds": round(seed_seconds, 2),
+            "cold": cold,
+            "warm": {
+                "runs": len(warm_runs),
+                "mean_seconds": round(float(seconds.mean()), 4),
+                "p50_seconds": round(float(np.percentile(seconds, 50)), 4),
+                "p95_seconds": round(float(np.percentile(seconds, 95)), 4),
+                "queries": max(run["queries"] for run in warm_runs),
+                "peak_mb": max(run["peak_mb"] for run in warm_runs),
+            },
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
@@ -0,0 +1,49 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from schedule.seating import SeatMap, best_block
+
+
+class Command(BaseCommand):
+    help = (
+        "Мікробенчмарк автовибору місць: best_block на залі rows×seats_per_row "
+        "з різною заповненістю і розміром компанії"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=40)
+        parser.add_argument('--seats-per-row', type=int, default=60)
+        parser.add_argument('--fill', type=float, nargs='+', default=[0.0, 0.5, 0.9, 0.99])
+        parser.add_argument('--party', type=int, nargs='+', default=[1, 4, 10])
+        parser.add_argument('--runs', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows, columns = options['rows'], options['seats_per_row']
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"Зал {rows}×{columns}, {options['runs']} запусків на випадок")
+        self.stdout.write(f"{'заповн.':>8} {'компанія':>9} {'p50, мкс':>10} {'p95, мкс':>10} {'знайдено':>9}")
+
+        for fill in options['fill']:
+            seat_map = SeatMap(rows, columns)
+            for row in range(1, rows + 1):
+                for column in range(1, columns + 1):
+                    if rng.random() < fill:
+                        seat_map.take(row, column)
+            occupancy = seat_map.availability()
+
+            for party in options['party']:
+                samples, found = [], 0
+                for _ in range(options['runs']):
+                    started = time.perf_counter()
+                    block = best_block(occupancy, rows, columns, party)
+                    samples.append(time.perf_counter() - started)
+                    found += block is not None
+                samples.sort()
+                p50 = samples[len(samples) // 2] * 1e6
+                p95 = samples[min(len(samples) - 1, len(samples) * 95 // 100)] * 1e6
+                self.stdout.write(
+                    f"{fill:>8.0%} {party:>9} {p50:>10.0f} {p95:>10.0f} {found / options['runs']:>9.0%}"
+                )
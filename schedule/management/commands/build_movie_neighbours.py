@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from schedule.recommendations import SIMILAR_MOVIES_K, refresh_movie_neighbours
+
+
+class Command(BaseCommand):
+    help = "Повністю перебудовує таблицю схожих фільмів (топ-K сусідів кожного фільму)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', type=int, default=SIMILAR_MOVIES_K)
+
+    def handle(self, *args, **options):
+        count = refresh_movie_neighbours(k=options['k'])
+        self.stdout.write(self.style.SUCCESS(f"Сусідів пораховано для {count} фільмів"))
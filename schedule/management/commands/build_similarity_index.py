@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from schedule.recommendations import (
+    _ensure_tfidf_cache, _tfidf_cache, save_similarity_index, similarity_index_dir
+)
+
+
+class Command(BaseCommand):
+    help = "Будує матрицю схожості фільмів і зберігає її на диск для всіх воркерів"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=None,
+            help="Каталог для індексу (за замовчуванням RECOMMENDATION_INDEX_DIR)"
+        )
+
+    def handle(self, *args, **options):
+        _ensure_tfidf_cache()
+        path = save_similarity_index(options['output'] or similarity_index_dir())
+        self.stdout.write(self.style.SUCCESS(
+            f"Індекс на {len(_tfidf_cache['movie_ids'])} фільмів збережено в {path}"
+        ))
@@ -0,0 +1,65 @@
+import csv
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from schedule.scheduling import (
+    SCHEDULE_BATCH_SIZE, SESSION_SLOT, ScheduleError, plan_sessions, read_schedule, schedule_sessions
+)
+
+MAX_SHOWN_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Імпортує розклад сеансів з CSV (заголовок movie,hall,datetime,price) "
+        "або JSONL. Фільм і зал — id або назва. Перетини в залах перевіряються "
+        "до запису; якщо є хоч одна помилка, не зберігається нічого"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="За замовчуванням — з розширення файлу")
+        parser.add_argument(
+            '--slot', type=int, default=int(SESSION_SLOT.total_seconds() // 60),
+            help="Скільки хвилин сеанс займає зал",
+        )
+        parser.add_argument('--batch-size', type=int, default=SCHEDULE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Лише перевірити розклад")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError("Вкажіть --format csv або jsonl")
+        slot = timedelta(minutes=options['slot'])
+
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                rows = read_schedule(stream, fmt)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            raise CommandError(f"Не вдалося прочитати розклад: {e}")
+        except ScheduleError as e:
+            raise CommandError(self._rejected(e))
+        try:
+            if options['dry_run']:
+                sessions = plan_sessions(rows, slot)
+            else:
+                sessions = schedule_sessions(rows, slot, options['batch_size'])
+        except ScheduleError as e:
+            raise CommandError(self._rejected(e))
+        elapsed = time.perf_counter() - started
+
+        action = "Перевірено" if options['dry_run'] else "Заплановано"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {len(sessions)} сеансів за {elapsed:.2f} с "
+            f"({len(sessions) / max(elapsed, 1e-9):.0f} сеансів/с)"
+        ))
+
+    def _rejected(self, error):
+        shown = error.errors[:MAX_SHOWN_ERRORS]
+        if len(error.errors) > len(shown):
+            shown.append(f"... і ще {len(error.errors) - len(shown)} помилок")
+        return "Розклад не імпортовано:\n" + "\n".join(shown)
@@ -0,0 +1,103 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from schedule.models import Movie, Viewer, ViewerRecommendation
+from schedule.recommendations import (
+    _get_cf_cache, _get_similarity_cache, score_recommendations, similarity_index_dir
+)
+
+CHECKPOINT_FILE = "precompute_checkpoint.json"
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _score_chunk(viewer_ids, top_k):
+    """Виконується в дочірньому процесі: топ-K для кожного глядача з пачки."""
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    return [
+        (viewer_id, score_recommendations(viewer_id, movie_ids, top_k))
+        for viewer_id in viewer_ids
+    ]
+
+
+def _save_chunk(results):
+    viewer_ids = [viewer_id for viewer_id, _ in results]
+    with transaction.atomic():
+        ViewerRecommendation.objects.filter(viewer_id__in=viewer_ids).delete()
+        ViewerRecommendation.objects.bulk_create([
+            ViewerRecommendation(viewer_id=viewer_id, movie_id=movie_id, rank=rank, score=score)
+            for viewer_id, ranked in results
+            for rank, (movie_id, score) in enumerate(ranked, start=1)
+        ])
+
+
+class Command(BaseCommand):
+    help = "Перераховує рекомендації для всіх глядачів паралельно і зберігає топ-K у ViewerRecommendation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20)
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help="Почати з початку, ігноруючи збережений прогрес"
+        )
+
+    def handle(self, *args, **options):
+        top_k = options['top_k']
+        chunk_size = options['chunk_size']
+        checkpoint = similarity_index_dir() / CHECKPOINT_FILE
+
+        last_viewer_id = 0
+        if checkpoint.exists() and not options['restart']:
+            last_viewer_id = json.loads(checkpoint.read_text())["last_viewer_id"]
+            self.stdout.write(f"Продовжуємо після глядача #{last_viewer_id}")
+
+        viewer_ids = list(
+            Viewer.objects.filter(id__gt=last_viewer_id)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        chunks = [viewer_ids[i:i + chunk_size] for i in range(0, len(viewer_ids), chunk_size)]
+
+        # матриці будуємо до fork, щоб дочірні процеси їх успадкували
+        _get_similarity_cache()
+        _get_cf_cache()
+
+        started = time.monotonic()
+        done = 0
+        for results in self._run(chunks, top_k, options['workers']):
+            _save_chunk(results)
+            done += len(results)
+            # пачки приходять по порядку, тож усе до цього id уже збережено
+            checkpoint.parent.mkdir(parents=True, exist_ok=True)
+            checkpoint.write_text(json.dumps({"last_viewer_id": results[-1][0]}))
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{done}/{len(viewer_ids)} глядачів, {done / elapsed:.1f} глядачів/с")
+
+        checkpoint.unlink(missing_ok=True)
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {done} глядачів за {elapsed:.1f} с ({rate:.1f} глядачів/с)"
+        ))
+
+    def _run(self, chunks, top_k, workers):
+        if workers <= 1:
+            for chunk in chunks:
+                yield _score_chunk(chunk, top_k)
+            return
+
+        # з'єднання з БД не можна ділити між процесами
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            yield from pool.map(_score_chunk, chunks, [top_k] * len(chunks))
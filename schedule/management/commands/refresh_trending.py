@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from schedule.trending import TRENDING_SIZE, rebuild_trending, refresh_trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Перераховує список популярних зараз фільмів для нових глядачів. "
+        "Запускати за розкладом (cron), наприклад раз на 5 хвилин"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=TRENDING_SIZE)
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Зібрати лічильники заново з історії активності та оцінок",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            trending = rebuild_trending(options['size'])
+        else:
+            trending = refresh_trending(options['size'])
+        self.stdout.write(self.style.SUCCESS(f"У списку популярних {len(trending)} фільмів"))
@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Модулі, які не повинні вантажитися воркером, що нічого не рекомендує
+HEAVY_MODULES = ("numpy", "scipy", "sklearn")
+
+# Що імпортує процес у кожному сценарії (після django.setup())
+SCENARIOS = {
+    # звичайний веб-воркер: URLConf тягне за собою всі вьюхи
+    "worker": "import school_project.urls",
+    # воркер, якому довелося порахувати рекомендації
+    "recommend": "import school_project.urls\nimport schedule.recommendations",
+}
+
+CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+{imports}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": sorted(m for m in {heavy!r} if m in sys.modules),
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Рядки `-X importtime`: "import time: self [us] | cumulative | package".
+    Повертає (загальний час у мкс, [(cumulative, package)] модулів верхнього рівня).
+    """
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            # заголовок таблиці
+            continue
+        # вкладеність позначена відступом перед іменем пакета
+        if not name[1:].startswith(" "):
+            top_level.append((cumulative, name.strip()))
+    return sum(us for us, _ in top_level), top_level
+
+
+def run_scenario(imports):
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "school_project.settings")
+    code = CHILD.format(imports=imports, heavy=HEAVY_MODULES)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    total_us, top_level = parse_importtime(proc.stderr)
+    result["import_seconds"] = total_us / 1e6
+    result["slowest_imports"] = sorted(top_level, reverse=True)
+    return result
+
+
+class Command(BaseCommand):
+    help = "Звіт про час старту та пам'ять воркера (на основі python -X importtime)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--repeat', type=int, default=3, help="Скільки разів запускати кожен сценарій")
+        parser.add_argument('--top', type=int, default=10, help="Скільки найповільніших імпортів показати")
+        parser.add_argument('--output', default=None, help="Зберегти результати у JSON")
+
+    def handle(self, *args, **options):
+        report = {}
+        for name in options['scenarios']:
+            # кращий з кількох запусків: прибирає шум холодного дискового кешу
+            runs = [run_scenario(SCENARIOS[name]) for _ in range(max(options['repeat'], 1))]
+            best = min(runs, key=lambda run: run["seconds"])
+            report[name] = {
+                "seconds": round(best["seconds"], 3),
+                "import_seconds": round(best["import_seconds"], 3),
+                "max_rss_mb": round(best["max_rss_mb"], 1),
+                "heavy_modules": best["heavy_modules"],
+                "slowest_imports": [
+                    {"module": module, "ms": round(us / 1000, 1)}
+                    for us, module in best["slowest_imports"][:options['top']]
+                ],
+            }
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: {report[name]['seconds']} с, {report[name]['max_rss_mb']} МБ, "
+                f"важкі модулі: {', '.join(best['heavy_modules']) or 'немає'}"
+            ))
+            for item in report[name]["slowest_imports"]:
+                self.stdout.write(f"  {item['ms']:>8} мс  {item['module']}")
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0027_livewatchsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewerRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='schedule.movie')),
+                ('viewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_recommendations', to='schedule.viewer')),
+            ],
+            options={
+                'ordering': ['viewer', 'rank'],
+                'unique_together': {('viewer', 'rank')},
+            },
+        ),
+    ]
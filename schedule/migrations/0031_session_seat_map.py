@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:28
+
+from django.db import migrations, models
+
+
+def build_seat_maps(apps, schema_editor):
+    """Переносить зайняті місця в Session.seat_map і видаляє рядки вільних місць."""
+    Seat = apps.get_model('schedule', 'Seat')
+    Session = apps.get_model('schedule', 'Session')
+
+    for session in Session.objects.select_related('hall').iterator():
+        columns = session.hall.seats_per_row
+        bits = bytearray((session.hall.rows * columns + 7) // 8)
+        reserved = Seat.objects.filter(session=session, is_reserved=True).values_list('row', 'column')
+        for row, column in reserved:
+            if 1 <= row <= session.hall.rows and 1 <= column <= columns:
+                index = (row - 1) * columns + (column - 1)
+                bits[index >> 3] |= 1 << (index & 7)
+        Session.objects.filter(pk=session.pk).update(seat_map=bytes(bits))
+
+    Seat.objects.filter(is_reserved=False).delete()
+
+
+def restore_seat_rows(apps, schema_editor):
+    """Зворотний шлях: знову рядок Seat на кожне місце залу."""
+    Seat = apps.get_model('schedule', 'Seat')
+    Session = apps.get_model('schedule', 'Session')
+
+    Seat.objects.update(is_reserved=True)
+    for session in Session.objects.select_related('hall').iterator():
+        sold = set(Seat.objects.filter(session=session).values_list('row', 'column'))
+        Seat.objects.bulk_create([
+            Seat(session=session, row=r, column=c)
+            for r in range(1, session.hall.rows + 1)
+            for c in range(1, session.hall.seats_per_row + 1)
+            if (r, c) not in sold
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0030_movietrend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='seat_map',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.RunPython(build_seat_maps, restore_seat_rows),
+        migrations.RemoveField(
+            model_name='seat',
+            name='is_reserved',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0031_session_seat_map'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='items',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
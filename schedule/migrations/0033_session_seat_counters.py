@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:40
+
+from django.db import migrations, models
+
+
+def fill_seat_counters(apps, schema_editor):
+    """Рахує місця залу і продані біти карти для вже створених сеансів."""
+    Session = apps.get_model('schedule', 'Session')
+
+    for session in Session.objects.select_related('hall').iterator():
+        total = session.hall.rows * session.hall.seats_per_row
+        bits = bytes(session.seat_map or b"")[:(total + 7) // 8]
+        sold = sum(bin(byte).count("1") for byte in bits)
+        Session.objects.filter(pk=session.pk).update(seats_total=total, seats_sold=sold)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0032_transaction_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='seats_sold',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Продано місць'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='seats_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Усього місць'),
+        ),
+        migrations.RunPython(fill_seat_counters, migrations.RunPython.noop),
+    ]
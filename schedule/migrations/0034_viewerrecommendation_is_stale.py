@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0033_session_seat_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='viewerrecommendation',
+            name='is_stale',
+            field=models.BooleanField(default=False),
+        ),
+    ]
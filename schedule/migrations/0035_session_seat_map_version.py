@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0034_viewerrecommendation_is_stale'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='seat_map_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
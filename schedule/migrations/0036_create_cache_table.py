@@ -0,0 +1,20 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # кеш за замовчуванням — таблиця в БД (CACHES у settings); без неї
+    # утримання місць не працюють, тож створюємо її разом зі схемою.
+    # Для Redis createcachetable нічого не робить
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0035_session_seat_map_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0037_dataversion_datachange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='viewer',
+            name='recommendations_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
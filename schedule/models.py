@@ -112,20 +112,71 @@ class Session(models.Model):
         default=120.00,
         verbose_name="Ціна квитка"
     )  # 💰
+    # Бітова карта зайнятих місць (див. schedule/seating.py); порожня — зал вільний
+    seat_map = models.BinaryField(default=b"", blank=True)
+    # Лічильники для списку сеансів без COUNT по Seat. seats_sold пишеться
+    # тим самим UPDATE, що й карта, тож завжди з нею збігається
+    seats_total = models.PositiveIntegerField(default=0, editable=False, verbose_name="Усього місць")
+    seats_sold = models.PositiveIntegerField(default=0, editable=False, verbose_name="Продано місць")
+    # +1 на кожну зміну карти тим самим UPDATE — версія для ETag api/session/<id>/seats/
+    seat_map_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Частка вільних місць, за якої сеанс позначається «майже розпродано»
+    ALMOST_SOLD_OUT_SHARE = 0.1
+    # Карту й продані місця змінюють лише продажі (schedule/seating.py) —
+    # звичайне збереження сеансу (адмінка) не перезаписує їх старими значеннями
+    SALES_FIELDS = ("seat_map", "seats_sold", "seat_map_version")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        session = super().from_db(db, field_names, values)
+        # зал, під який порахована карта, — щоб помітити його зміну в save
+        session._loaded_hall_id = session.__dict__.get('hall_id')
+        return session
+
+    def _hall_changed(self):
+        loaded = getattr(self, '_loaded_hall_id', None)
+        return not self._state.adding and loaded is not None and loaded != self.hall_id
 
-    def __str__(self):
-        return f"{self.movie.title} – {self.datetime.strftime('%Y-%m-%d %H:%M')}"
+    def clean(self):
+        super().clean()
+        if self._hall_changed() and Seat.objects.filter(session=self).exists():
+            raise ValidationError({'hall': "На сеанс уже продано квитки — зал змінити не можна."})
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
+        hall_changed = self._hall_changed()
+        if kwargs.get('update_fields') is None:
+            self.seats_total = self.hall.rows * self.hall.seats_per_row
+            if not self._state.adding and not kwargs.get('force_insert'):
+                # Лише UPDATE без полів продажів. На відміну від звичайного
+                # save, рядок, який тим часом видалили, не вставиться знову —
+                # Django кине DatabaseError (для сеансу так і треба: разом із
+                # ним каскадом зникли й квитки).
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.SALES_FIELDS
+                ]
         super().save(*args, **kwargs)
-        if is_new:
-            seats_to_create = [
-                Seat(session=self, row=r, column=c)
-                for r in range(1, self.hall.rows + 1)
-                for c in range(1, self.hall.seats_per_row + 1)
-            ]
-            Seat.objects.bulk_create(seats_to_create)
+        if hall_changed:
+            # карту й лічильники рахували під старий зал
+            from .seating import rebuild_seat_map
+            rebuild_seat_map(self.pk)
+        self._loaded_hall_id = self.hall_id
+
+    @property
+    def seats_left(self):
+        return max(self.seats_total - self.seats_sold, 0)
+
+    @property
+    def is_sold_out(self):
+        return self.seats_total > 0 and self.seats_left == 0
+
+    @property
+    def is_almost_sold_out(self):
+        return 0 < self.seats_left <= self.seats_total * self.ALMOST_SOLD_OUT_SHARE
+
+    def __str__(self):
+        return f"{self.movie.title} – {self.datetime.strftime('%Y-%m-%d %H:%M')}"
 
 
 class Viewer(models.Model):
@@ -151,6 +202,8 @@ class Viewer(models.Model):
         default="profile_images/standart_avatar.png"
     )
     is_online = models.BooleanField(default=False)  # 👈 хто зараз дивиться
+    # росте при кожному скиданні рекомендацій глядача (див. schedule/recommender.py)
+    recommendations_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.first_name or ''} {self.last_name or ''}".strip()
@@ -160,11 +213,11 @@ class Viewer(models.Model):
         return Session.objects.filter(seats__viewer=self).distinct()
 
 
+# Продане місце. Вільні місця рядків не мають — лише біти в Session.seat_map
 class Seat(models.Model):
     session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="seats")
     row = models.PositiveIntegerField()
     column = models.PositiveIntegerField()
-    is_reserved = models.BooleanField(default=False)
     viewer = models.ForeignKey(
         Viewer,
         on_delete=models.SET_NULL,
@@ -177,7 +230,7 @@ class Seat(models.Model):
         unique_together = ("session", "row", "column")
 
     def __str__(self):
-        return f"Row {self.row}, Col {self.column} – {'Reserved' if self.is_reserved else 'Free'}"
+        return f"Row {self.row}, Col {self.column} – {self.viewer or 'Reserved'}"
 
 
 class Bookmark(models.Model):
@@ -356,6 +409,73 @@ class MovieActivity(models.Model):
         return f"{self.viewer} — {self.movie} ({self.time_spent:.1f}s)"
 
 
+# 🎯 Заздалегідь пораховані рекомендації (manage.py precompute_recommendations)
+class ViewerRecommendation(models.Model):
+    viewer = models.ForeignKey(Viewer, on_delete=models.CASCADE, related_name='precomputed_recommendations')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+    # глядач щось оцінив/додав після розрахунку — список лише як тимчасовий
+    is_stale = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('viewer', 'rank')
+        ordering = ['viewer', 'rank']
+
+    def __str__(self):
+        return f"{self.viewer} — #{self.rank} {self.movie}"
+
+
+# 🎞 Схожі фільми: топ-K сусідів кожного фільму (див. refresh_movie_neighbours)
+class MovieNeighbour(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('movie', 'rank')
+        ordering = ['movie', 'rank']
+
+    def __str__(self):
+        return f"{self.movie} → #{self.rank} {self.neighbour}"
+
+
+# 🔢 Версії даних для кешів рекомендацій: лічильник потоку ("catalog",
+# "ratings") і журнал змін під кожною версією (див. schedule/signals.py)
+class DataVersion(models.Model):
+    stream = models.CharField(max_length=20, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.stream}: {self.version}"
+
+
+class DataChange(models.Model):
+    stream = models.CharField(max_length=20)
+    version = models.PositiveBigIntegerField()
+    # None — змінився весь потік
+    object_id = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('stream', 'version')
+
+    def __str__(self):
+        return f"{self.stream} v{self.version}: {self.object_id}"
+
+
+# 🔥 Популярність фільму із загасанням у часі (див. schedule/trending.py)
+class MovieTrend(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    score = models.FloatField(default=0.0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.movie}: {self.score:.3g}"
+
+
 # 💰 Кошелек глядача
 class Wallet(models.Model):
     viewer = models.OneToOneField(Viewer, on_delete=models.CASCADE, related_name='wallet')
@@ -379,24 +499,6 @@ class PromoCode(models.Model):
     def __str__(self):
         return f"{self.code} (+{self.amount}₴)"
 
-    def is_valid_for(self, viewer):
-        """Перевірка, чи можна використати промокод цим користувачем"""
-        if not self.is_active:
-            return False, "Промокод неактивний."
-        if self.expires_at and timezone.now() > self.expires_at:
-            return False, "Строк дії промокоду вичерпано."
-        if self.used_by.filter(id=viewer.id).exists():
-            return False, "Ви вже використали цей промокод."
-        if self.used_count >= self.max_uses:
-            return False, "Ліміт активацій промокоду вичерпано."
-        return True, None
-
-    def mark_used(self, viewer):
-        """Позначаємо використання промокоду"""
-        self.used_by.add(viewer)
-        self.used_count += 1
-        self.save(update_fields=["used_count"])
-
 
 # 💳 Історія транзакцій
 class Transaction(models.Model):
@@ -411,6 +513,8 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=8, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.CharField(max_length=255, blank=True, null=True)
+    # Позиції групової покупки: [{"row": 3, "column": 7, "price": "150.00"}, ...]
+    items = models.JSONField(default=list, blank=True)
 
     class Meta:
         ordering = ['-created_at']
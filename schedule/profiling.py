@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('schedule.recommendations')
+
+
+# ============================================================
+# === Поэтапные замеры hybrid_recommendations ================
+# ============================================================
+# Каждый расчёт разбит на этапы (catalog, ratings, activity,
+# similarity, ranking); для каждого меряется время и число
+# SQL-запросов. Готовый замер отдаётся всем хукам из
+# settings.RECOMMENDATION_TIMING_HOOKS — это обычные функции
+# hook(timings), так что логирование, заголовки и статистику можно
+# включать и выключать независимо.
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                yield
+        finally:
+            self.stages[name] = {"seconds": time.perf_counter() - started, "queries": queries}
+
+    def timings(self):
+        return {
+            "total": {
+                "seconds": time.perf_counter() - self.started,
+                "queries": sum(stage["queries"] for stage in self.stages.values()),
+            },
+            **self.stages,
+        }
+
+
+class NullTimer:
+    """Заглушка для пакетного расчёта, где замеры не нужны."""
+
+    def stage(self, name):
+        return nullcontext()
+
+
+NULL_TIMER = NullTimer()
+
+
+_hooks = {}
+
+
+def timing_hooks():
+    paths = tuple(getattr(settings, 'RECOMMENDATION_TIMING_HOOKS', ()))
+    if paths not in _hooks:
+        _hooks[paths] = [import_string(path) for path in paths]
+    return _hooks[paths]
+
+
+def emit_timings(timings):
+    for hook in timing_hooks():
+        try:
+            hook(timings)
+        except Exception:
+            # сломанный хук не должен ломать рекомендации
+            logger.exception("Recommendation timing hook %r failed", hook)
+
+
+def format_timings(timings):
+    return ", ".join(
+        f"{name}={stage['seconds'] * 1000:.1f}ms/{stage['queries']}q"
+        for name, stage in timings.items()
+    )
+
+
+# === Хук: лог ===
+def log_timings(timings):
+    logger.info("hybrid_recommendations: %s", format_timings(timings))
+
+
+# === Хук: перцентили по скользящему окну ===
+class RollingPercentiles:
+    """Последние window замеров каждого этапа и их перцентили."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, timings):
+        with self._lock:
+            for name, stage in timings.items():
+                samples = self._samples.setdefault(name, deque(maxlen=self.window))
+                samples.append(stage["seconds"])
+
+    def summary(self, percentiles=(50, 95, 99)):
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self._samples.items()}
+        return {
+            name: {
+                "count": len(samples),
+                **{
+                    f"p{p}": samples[min(len(samples) - 1, len(samples) * p // 100)]
+                    for p in percentiles
+                },
+            }
+            for name, samples in snapshot.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+recommendation_stats = RollingPercentiles()
+
+
+def record_percentiles(timings):
+    recommendation_stats.add(timings)
+
+
+# === Хук: заголовки ответа в DEBUG ===
+# Middleware открывает «корзину» на время запроса, хук складывает в
+# неё замеры из этого же потока, а в ответ они уходят заголовком
+# Server-Timing (виден во вкладке Network браузера). Фоновые расчёты
+# идут в других потоках и сюда не попадают — для них есть лог и
+# перцентили.
+_request_timings = threading.local()
+
+
+def collect_for_response(timings):
+    collected = getattr(_request_timings, "runs", None)
+    if collected is not None:
+        collected.append(timings)
+
+
+class RecommendationTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+
+        _request_timings.runs = []
+        try:
+            response = self.get_response(request)
+            runs = _request_timings.runs
+        finally:
+            _request_timings.runs = None
+
+        if runs:
+            response['Server-Timing'] = ", ".join(
+                f'rec-{name};dur={stage["seconds"] * 1000:.2f};desc="{stage["queries"]} queries"'
+                for timings in runs
+                for name, stage in timings.items()
+            )
+        return response
@@ -1,62 +1,481 @@
-from django.db.models import Avg
+import json
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Max
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-from .models import Movie, MovieActivity, Rating
+from scipy import sparse
+from .ann import LSHIndex
+from .models import Movie, MovieActivity, MovieNeighbour, Rating
+from .profiling import NULL_TIMER, StageTimer, emit_timings
+from .trending import trending_movies
+from .signals import catalog_changes, catalog_version, ratings_changes, ratings_version
 import numpy as np
 
 
+# Вес компонент в схожести фильмов
+GENRE_WEIGHT = 0.45
+DESCRIPTION_WEIGHT = 0.55
+
+# Доля популярности в рекомендациях зрителя без оценок
+TRENDING_WEIGHT = 0.5
+
+
 # ============================================================
 # === 1. Сходство по жанрам ==================================
 # ============================================================
-def genre_similarity(base_movie, candidate):
-    base_genres = set(base_movie.genres.values_list('id', flat=True))
-    candidate_genres = set(candidate.genres.values_list('id', flat=True))
+# Жанры фильма хранятся битовой маской: жанр genre_index[id] — это
+# один бит, маска — строка из uint64-слов (по 64 жанра на слово).
+# Тогда Жаккар — popcount(a & b) / popcount(a | b), без множеств и
+# без запросов, и считается сразу для всех кандидатов.
+GENRE_WORD_BITS = 64
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    # numpy < 2.0: popcount через таблицу по байтам
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x):
+        x = np.ascontiguousarray(x)
+        return _POPCOUNT_TABLE[x.view(np.uint8)].reshape(*x.shape, -1).sum(axis=-1)
+
+
+def _genre_words(n_genres):
+    return max(1, -(-n_genres // GENRE_WORD_BITS))
 
-    if not base_genres or not candidate_genres:
-        return 0.0
 
-    intersection = len(base_genres & candidate_genres)
-    union = len(base_genres | candidate_genres)
-    return intersection / union
+def _genre_masks(rows, bits, n_rows, n_genres):
+    """Маски n_rows фильмов: у строки rows[i] взведён бит bits[i]."""
+    masks = np.zeros((n_rows, _genre_words(n_genres)), dtype=np.uint64)
+    bits = np.asarray(bits, dtype=np.uint64)
+    word_bits = np.uint64(GENRE_WORD_BITS)
+    np.bitwise_or.at(
+        masks,
+        (np.asarray(rows, dtype=np.int64), (bits // word_bits).astype(np.int64)),
+        np.uint64(1) << (bits % word_bits),
+    )
+    return masks
+
+
+def _genre_jaccard(a, b):
+    """Жаккар для всех пар масок a × b: popcount(a & b) / popcount(a | b)."""
+    intersection = np.zeros((len(a), len(b)), dtype=np.float32)
+    union = np.zeros_like(intersection)
+    for word in range(a.shape[1]):
+        x, y = a[:, word, None], b[None, :, word]
+        intersection += _popcount(x & y)
+        union += _popcount(x | y)
+    return np.divide(
+        intersection, union,
+        out=np.zeros_like(intersection),
+        where=union > 0
+    )
+
+
+def genre_similarity(base_movie, candidate):
+    cache = _get_similarity_cache([base_movie.id, candidate.id])
+    masks, index = cache["genres"], cache["index"]
+    return float(_genre_jaccard(
+        masks[[index[base_movie.id]]], masks[[index[candidate.id]]]
+    )[0, 0])
 
 
 # ============================================================
-# === 2. TF-IDF кэш ==========================================
+# === 2. Матрица сходства фильмов ============================
 # ============================================================
-_tfidf_cache = {"vectorizer": None, "matrix": None, "movie_ids": None}
+# Строится один раз на весь каталог: similarity[i, j] — схожесть
+# фильма в строке i с фильмом в строке j (жанры + TF-IDF описаний).
+# version — версия каталога (см. signals.py), под которую собран кэш.
+#
+# Кэши общие для потоков воркера (запросы + фоновый пул recommender.py),
+# поэтому любая проверка версии с перестройкой или правкой идёт под
+# _cache_lock, а наружу отдаётся снимок — копия словаря. Правки строк не
+# трогают списки и словари, на которые могут ссылаться старые снимки,
+# а собирают новые. RLock — перестройка вызывается из-под проверки.
+_cache_lock = threading.RLock()
+
+_tfidf_cache = {
+    "vectorizer": None,
+    "matrix": None,
+    "movie_ids": None,
+    "index": None,
+    "genres": None,
+    "genre_index": None,
+    "similarity": None,
+    "ann": None,
+    "version": None,
+}
+
+# Сколько соседей хранится для каждого фильма в MovieNeighbour
+SIMILAR_MOVIES_K = getattr(settings, 'RECOMMENDATION_SIMILAR_MOVIES_K', 20)
+
+# Сколько изменённых фильмов выгоднее догнать построчно, а не перестроить всё
+MAX_INCREMENTAL_CHANGES = 50
+
+# Режим схожести описаний (settings.RECOMMENDATION_SIMILARITY_MODE):
+# "exact" — полная матрица n × n, "approximate" — LSH-индекс (см. ann.py)
+# для больших каталогов, где квадратичная матрица не помещается в память.
+ANN_NEIGHBOURS = 50
+
 
-def _ensure_tfidf_cache():
-    movies = Movie.objects.all()
+def similarity_mode():
+    return getattr(settings, 'RECOMMENDATION_SIMILARITY_MODE', 'exact')
+
+
+def _make_vectorizer(**kwargs):
+    return TfidfVectorizer(stop_words='english', max_features=5000, **kwargs)
+
+
+def _movie_text(movie):
+    return (movie.full_description or "") + " " + (movie.short_description or "")
+
+
+def _ensure_tfidf_cache(version=None):
+    with _cache_lock:
+        _build_tfidf_cache(version)
+
+
+def _build_tfidf_cache(version):
+    if version is None:
+        version = catalog_version()
+    movies = list(Movie.objects.only('id', 'short_description', 'full_description'))
     ids = [m.id for m in movies]
-    texts = [
-        (m.full_description or "") + " " + (m.short_description or "")
-        for m in movies
-    ]
-    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
-    matrix = vectorizer.fit_transform(texts)
+    index = {movie_id: row for row, movie_id in enumerate(ids)}
+
+    approximate = similarity_mode() == 'approximate'
+    vectorizer = _make_vectorizer()
+    try:
+        matrix = vectorizer.fit_transform([_movie_text(m) for m in movies]).tocsr()
+    except ValueError:
+        # пустой каталог или описания без единого значимого слова
+        vectorizer, matrix = None, None
+
+    # Все жанры одним запросом, без obj.genres.all() на каждый фильм
+    genre_pairs = list(
+        Movie.genres.through.objects
+        .filter(movie_id__in=ids)
+        .values_list('movie_id', 'genre_id')
+    )
+    genre_index = {
+        genre_id: col
+        for col, genre_id in enumerate(sorted({genre_id for _, genre_id in genre_pairs}))
+    }
+    genres = _genre_masks(
+        [index[movie_id] for movie_id, _ in genre_pairs],
+        [genre_index[genre_id] for _, genre_id in genre_pairs],
+        len(ids), len(genre_index),
+    )
+
+    similarity, ann = None, None
+    if approximate:
+        if matrix is not None:
+            ann = LSHIndex(matrix)
+    else:
+        similarity = _similarity_matrix(genres, matrix)
 
     _tfidf_cache.update({
         "vectorizer": vectorizer,
         "matrix": matrix,
-        "movie_ids": ids
+        "movie_ids": ids,
+        "index": index,
+        "genres": genres,
+        "genre_index": genre_index,
+        "similarity": similarity,
+        "ann": ann,
+        "version": version,
     })
 
 
-def description_similarity(base_movie, candidate):
-    if _tfidf_cache["matrix"] is None:
-        _ensure_tfidf_cache()
+def _similarity_matrix(genres, matrix, block=1024):
+    """
+    Полная матрица схожести, собранная полосами по block строк: в памяти
+    одновременно только итоговая float32-матрица и одна полоса.
+    """
+    n = genres.shape[0]
+    similarity = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        band = GENRE_WEIGHT * _genre_jaccard(genres[start:stop], genres)
+        if matrix is not None:
+            # строки TF-IDF нормированы по L2, поэтому косинус — это скалярное произведение
+            band += DESCRIPTION_WEIGHT * (matrix[start:stop] @ matrix.T).toarray()
+        similarity[start:stop] = band
+    return similarity
+
+
+def _remove_movie_row(movie_id):
+    row = _tfidf_cache["index"].get(movie_id)
+    if row is None:
+        return
+    keep = np.arange(len(_tfidf_cache["movie_ids"])) != row
+    ids = [m for m in _tfidf_cache["movie_ids"] if m != movie_id]
+    _tfidf_cache.update({
+        "movie_ids": ids,
+        "index": {m: r for r, m in enumerate(ids)},
+        "genres": _tfidf_cache["genres"][keep],
+        "similarity": _tfidf_cache["similarity"][np.ix_(keep, keep)],
+    })
+    if _tfidf_cache["matrix"] is not None:
+        _tfidf_cache["matrix"] = _tfidf_cache["matrix"][keep]
+
+
+def _update_movie_row(movie_id):
+    """
+    Пересчитывает строку одного фильма без повторного fit: описание
+    проецируется на уже выученный словарь TF-IDF. False — если правку
+    нельзя применить построчно и нужна полная перестройка.
+    """
+    movie = Movie.objects.filter(pk=movie_id).first()
+    if movie is None:
+        if _tfidf_cache["ann"] is not None:
+            # удаление сдвигает строки, а LSH-индекс их не перенумеровывает
+            return False
+        _remove_movie_row(movie_id)
+        return True
+
+    genre_ids = list(
+        Movie.genres.through.objects
+        .filter(movie_id=movie_id)
+        .values_list('genre_id', flat=True)
+    )
+    genre_index = dict(_tfidf_cache["genre_index"])
+    genres = _tfidf_cache["genres"]
+    for genre_id in genre_ids:
+        if genre_id not in genre_index:
+            genre_index[genre_id] = len(genre_index)
+    words = _genre_words(len(genre_index))
+    if words > genres.shape[1]:
+        # новый жанр не влез в последнее слово маски
+        genres = np.hstack([genres, np.zeros((genres.shape[0], words - genres.shape[1]), dtype=np.uint64)])
+    genre_row = _genre_masks(
+        [0] * len(genre_ids), [genre_index[g] for g in genre_ids], 1, len(genre_index),
+    )
+
+    tfidf_row = _tfidf_cache["vectorizer"].transform([_movie_text(movie)]).tocsr()
+    matrix = _tfidf_cache["matrix"]
+    similarity = _tfidf_cache["similarity"]
+    ann = _tfidf_cache["ann"]
+    index = _tfidf_cache["index"]
+    movie_ids = _tfidf_cache["movie_ids"]
+
+    row = index.get(movie_id)
+    if row is None:
+        row = len(movie_ids)
+        movie_ids = movie_ids + [movie_id]
+        index = {**index, movie_id: row}
+        genres = np.vstack([genres, genre_row])
+        matrix = sparse.vstack([matrix, tfidf_row]).tocsr()
+        if similarity is not None:
+            similarity = np.pad(similarity, ((0, 1), (0, 1)))
+    else:
+        if similarity is not None:
+            # правим свою копию: старую матрицу (или mmap с диска, только
+            # чтение) могут прямо сейчас читать запросы со снимком кэша
+            similarity = np.array(similarity)
+        genres = genres.copy()
+        genres[row] = genre_row[0]
+        matrix = sparse.vstack([matrix[:row], tfidf_row, matrix[row + 1:]]).tocsr()
+
+    if ann is not None:
+        # приближённый режим: достаточно переложить строку в корзинах LSH
+        _tfidf_cache.update({
+            "matrix": matrix, "movie_ids": movie_ids, "index": index,
+            "genres": genres, "genre_index": genre_index, "ann": ann.with_row(row, tfidf_row),
+        })
+        return True
+
+    # строки TF-IDF нормированы по L2, поэтому косинус — это скалярное произведение
+    desc_row = np.asarray((matrix @ tfidf_row.T).todense()).ravel()
+    sim_row = (
+        GENRE_WEIGHT * _genre_jaccard(genres, genre_row)[:, 0]
+        + DESCRIPTION_WEIGHT * desc_row
+    ).astype(np.float32)
+    similarity[row, :] = sim_row
+    similarity[:, row] = sim_row
+
+    _tfidf_cache.update({
+        "matrix": matrix,
+        "movie_ids": movie_ids,
+        "index": index,
+        "genres": genres,
+        "genre_index": genre_index,
+        "similarity": similarity,
+    })
+    return True
+
+
+def _get_similarity_cache(movie_ids=None):
+    """
+    Возвращает матрицу сходства, актуальную для текущей версии каталога.
+    Если воркер отстал на несколько правок — обновляет только их строки,
+    иначе перестраивает матрицу целиком.
+    """
+    version = catalog_version()
+    with _cache_lock:
+        local_version = _tfidf_cache["version"]
+
+        approximate = similarity_mode() == 'approximate'
+        if _tfidf_cache["index"] is None:
+            local_version = None if approximate else load_similarity_index(version=version)
+        elif approximate != (_tfidf_cache["similarity"] is None):
+            # режим переключили в настройках — кэш собран под другой
+            local_version = None
+
+        if local_version is None or local_version > version:
+            _ensure_tfidf_cache(version)
+        elif local_version < version:
+            changes = catalog_changes(local_version, version)
+            if (
+                changes is None
+                or None in changes
+                or _tfidf_cache["vectorizer"] is None
+                or len(set(changes)) > MAX_INCREMENTAL_CHANGES
+                or not all(_update_movie_row(movie_id) for movie_id in dict.fromkeys(changes))
+            ):
+                _ensure_tfidf_cache(version)
+            else:
+                _tfidf_cache["version"] = version
 
+        # страховка для bulk_create/update, которые не шлют сигналов
+        if movie_ids is not None and any(m not in _tfidf_cache["index"] for m in movie_ids):
+            _ensure_tfidf_cache(version)
+        return dict(_tfidf_cache)
+
+
+# ============================================================
+# === 2.1 Индекс на диске, общий для всех воркеров ===========
+# ============================================================
+# manage.py build_similarity_index сохраняет матрицу в .npy, а воркеры
+# открывают её через mmap — одна копия в page cache на все процессы.
+INDEX_FILES = {
+    "similarity": "similarity.npy",
+    "movie_ids": "movie_ids.npy",
+    "genres": "genres.npy",
+    "genre_ids": "genre_ids.npy",
+    "vocabulary": "vocabulary.npy",
+    "idf": "idf.npy",
+    "matrix": "tfidf.npz",
+    "meta": "meta.json",
+}
+
+
+def similarity_index_dir():
+    return Path(getattr(
+        settings, 'RECOMMENDATION_INDEX_DIR',
+        Path(settings.BASE_DIR) / 'recommendation_index'
+    ))
+
+
+def save_similarity_index(path=None):
+    """Записывает текущий кэш сходства на диск. meta.json пишется последним."""
+    with _cache_lock:
+        cache = dict(_tfidf_cache)
+    if cache["similarity"] is None:
+        raise ValueError("Индекс на диске поддерживается только в режиме exact")
+    path = Path(path or similarity_index_dir())
+    path.mkdir(parents=True, exist_ok=True)
+    vectorizer = cache["vectorizer"]
+
+    genre_ids = sorted(cache["genre_index"], key=cache["genre_index"].get)
+    arrays = {
+        "similarity": np.ascontiguousarray(cache["similarity"], dtype=np.float32),
+        "movie_ids": np.array(cache["movie_ids"], dtype=np.int64),
+        "genres": cache["genres"],
+        "genre_ids": np.array(genre_ids, dtype=np.int64),
+        "vocabulary": vectorizer.get_feature_names_out().astype(str) if vectorizer else np.array([], dtype=str),
+        "idf": vectorizer.idf_ if vectorizer else np.array([], dtype=np.float64),
+    }
+
+    def _replace(name, write):
+        target = path / INDEX_FILES[name]
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, "wb") as fh:
+            write(fh)
+        os.replace(tmp, target)
+
+    for name, array in arrays.items():
+        _replace(name, lambda fh, array=array: np.save(fh, array))
+    if cache["matrix"] is not None:
+        _replace("matrix", lambda fh: sparse.save_npz(fh, cache["matrix"]))
+    meta = {"version": cache["version"], "movies": len(cache["movie_ids"])}
+    _replace("meta", lambda fh: fh.write(json.dumps(meta).encode()))
+    return path
+
+
+def load_similarity_index(path=None, version=None):
+    """
+    Открывает индекс с диска в _tfidf_cache. Возвращает версию каталога,
+    под которую он собран, или None, если индекса нет, он неполный или
+    новее счётчика version.
+    """
+    path = Path(path or similarity_index_dir())
     try:
-        base_idx = _tfidf_cache["movie_ids"].index(base_movie.id)
-        cand_idx = _tfidf_cache["movie_ids"].index(candidate.id)
-    except ValueError:
-        _ensure_tfidf_cache()
-        base_idx = _tfidf_cache["movie_ids"].index(base_movie.id)
-        cand_idx = _tfidf_cache["movie_ids"].index(candidate.id)
+        meta = json.loads((path / INDEX_FILES["meta"]).read_text())
+        similarity = np.load(path / INDEX_FILES["similarity"], mmap_mode='r')
+        movie_ids = np.load(path / INDEX_FILES["movie_ids"])
+        genres = np.load(path / INDEX_FILES["genres"])
+        genre_ids = np.load(path / INDEX_FILES["genre_ids"])
+        if genres.dtype == bool:
+            # индекс старого формата (матрица bool) — упаковываем в маски
+            rows, cols = np.nonzero(genres)
+            genres = _genre_masks(rows, cols, genres.shape[0], genres.shape[1])
+        vocabulary = np.load(path / INDEX_FILES["vocabulary"])
+        idf = np.load(path / INDEX_FILES["idf"])
+    except (OSError, ValueError):
+        return None
+
+    n = len(movie_ids)
+    if meta.get("movies") != n or similarity.shape != (n, n) or genres.shape[0] != n:
+        # файлы от разных сборок — лучше перестроить
+        return None
+
+    vectorizer, matrix = None, None
+    if len(vocabulary):
+        try:
+            matrix = sparse.load_npz(path / INDEX_FILES["matrix"]).tocsr()
+        except (OSError, ValueError):
+            return None
+        vectorizer = _make_vectorizer(vocabulary={t: i for i, t in enumerate(vocabulary)})
+        vectorizer.idf_ = idf
+
+    disk_version = meta.get("version")
+    if version is not None and (disk_version is None or disk_version > version):
+        # счётчик версий начат заново (например, БД восстановили из копии), и по номеру
+        # уже не понять, какие правки каталога индекс не видел — перестраиваем
+        return None
+
+    ids = [int(m) for m in movie_ids]
+
+    with _cache_lock:
+        _tfidf_cache.update({
+            "vectorizer": vectorizer,
+            "matrix": matrix,
+            "movie_ids": ids,
+            "index": {movie_id: row for row, movie_id in enumerate(ids)},
+            "genres": genres,
+            "genre_index": {int(g): col for col, g in enumerate(genre_ids)},
+            "similarity": similarity,
+            "ann": None,
+            "version": disk_version,
+        })
+    return disk_version
+
+
+def description_similarity(base_movie, candidate):
+    cache = _get_similarity_cache([base_movie.id, candidate.id])
+    index = cache["index"]
+
+    if cache["matrix"] is None:
+        return 0.0
 
     sim = cosine_similarity(
-        _tfidf_cache["matrix"][base_idx],
-        _tfidf_cache["matrix"][cand_idx]
+        cache["matrix"][index[base_movie.id]],
+        cache["matrix"][index[candidate.id]]
     )[0][0]
 
     return float(sim)
@@ -85,6 +504,204 @@ def recent_activity_score(viewer, candidate):
     return min(score, 1.0)
 
 
+def activity_vectors(viewer, index):
+    """
+    Вся активность зрителя одним запросом в массивы, индексированные
+    строкой фильма: (time_spent, watched_trailer, watched_movie).
+    """
+    n = len(index)
+    time_spent = np.zeros(n, dtype=np.float32)
+    watched_trailer = np.zeros(n, dtype=bool)
+    watched_movie = np.zeros(n, dtype=bool)
+
+    rows = MovieActivity.objects.filter(viewer=viewer).values_list(
+        'movie_id', 'time_spent', 'watched_trailer', 'watched_movie'
+    )
+    for movie_id, spent, trailer, movie in rows:
+        row = index.get(movie_id)
+        if row is None:
+            continue
+        time_spent[row] = spent
+        watched_trailer[row] = trailer
+        watched_movie[row] = movie
+
+    return time_spent, watched_trailer, watched_movie
+
+
+def activity_scores(time_spent, watched_trailer, watched_movie):
+    """Те же баллы, что и recent_activity_score, но сразу для всех фильмов."""
+    score = (
+        np.minimum(time_spent / 300, 1.0) * 0.6
+        + watched_trailer * 0.25
+        + watched_movie * 0.15
+    )
+    return np.minimum(score, 1.0)
+
+
+def trending_vector(index):
+    """Популярность фильмов (0..1 от лидера) из готового списка trending.py."""
+    trend = np.zeros(len(index), dtype=np.float32)
+    for movie_id, score in trending_movies():
+        row = index.get(movie_id)
+        if row is not None:
+            trend[row] = score
+    top = trend.max() if len(trend) else 0.0
+    return trend / top if top > 0 else trend
+
+
+# ============================================================
+# === 3.1 Коллаборативная фильтрация (item-based) ============
+# ============================================================
+# R — разреженная матрица зритель × фильм со значениями mood из оценок.
+# Храним только Грам-матрицу gram = Rᵀ·R (совместные оценки фильмов):
+# косинус фильмов i, j = gram[i, j] / (‖i‖·‖j‖), где ‖i‖² = gram[i, i].
+# Новая оценка зрителя меняет gram на outer(новая строка) − outer(старая),
+# поэтому пересчёт инкрементальный и без плотных промежуточных матриц.
+COLLABORATIVE_WEIGHT = 0.3
+
+_cf_cache = {
+    "gram": None,
+    "movie_index": None,
+    "viewer_rows": None,
+    "version": None,
+}
+
+
+def _mood(score):
+    return (score - 5) / 5.0
+
+
+def _ensure_cf_cache(version=None):
+    with _cache_lock:
+        _build_cf_cache(version)
+
+
+def _build_cf_cache(version):
+    if version is None:
+        version = ratings_version()
+    ratings = list(Rating.objects.values_list('viewer_id', 'movie_id', 'score'))
+
+    movie_index = {
+        movie_id: col
+        for col, movie_id in enumerate(sorted({movie_id for _, movie_id, _ in ratings}))
+    }
+    viewer_index = {}
+    viewer_rows = {}
+    for viewer_id, movie_id, score in ratings:
+        viewer_index.setdefault(viewer_id, len(viewer_index))
+        viewer_rows.setdefault(viewer_id, {})[movie_index[movie_id]] = _mood(score)
+
+    r = sparse.csr_matrix(
+        (
+            [_mood(score) for _, _, score in ratings],
+            ([viewer_index[v] for v, _, _ in ratings], [movie_index[m] for _, m, _ in ratings]),
+        ),
+        shape=(len(viewer_index), len(movie_index)),
+        dtype=np.float64,
+    )
+
+    _cf_cache.update({
+        "gram": (r.T @ r).tocsr(),
+        "movie_index": movie_index,
+        "viewer_rows": viewer_rows,
+        "version": version,
+    })
+
+
+def _row_outer(row, size):
+    """outer(r) = rᵀ·r для разреженной строки зрителя {колонка: mood}."""
+    if not row:
+        return sparse.csr_matrix((size, size))
+    cols = np.fromiter(row.keys(), dtype=np.int64)
+    vals = np.fromiter(row.values(), dtype=np.float64)
+    vec = sparse.csr_matrix((vals, (np.zeros(len(cols), dtype=np.int64), cols)), shape=(1, size))
+    return vec.T @ vec
+
+
+def _update_cf_viewers(viewer_ids):
+    """Перечитывает оценки изменившихся зрителей одним запросом и правит gram."""
+    movie_index = dict(_cf_cache["movie_index"])
+    viewer_rows = dict(_cf_cache["viewer_rows"])
+
+    fresh = {viewer_id: {} for viewer_id in viewer_ids}
+    for viewer_id, movie_id, score in Rating.objects.filter(
+        viewer_id__in=viewer_ids
+    ).values_list('viewer_id', 'movie_id', 'score'):
+        if movie_id not in movie_index:
+            movie_index[movie_id] = len(movie_index)
+        fresh[viewer_id][movie_index[movie_id]] = _mood(score)
+
+    size = len(movie_index)
+    gram = _cf_cache["gram"]
+    if gram.shape[0] < size:
+        # новые фильмы получили оценки впервые — расширяем матрицу
+        gram = gram.tocoo()
+        gram = sparse.csr_matrix((gram.data, (gram.row, gram.col)), shape=(size, size))
+
+    for viewer_id, row in fresh.items():
+        old = viewer_rows.get(viewer_id, {})
+        gram = gram - _row_outer(old, size) + _row_outer(row, size)
+        if row:
+            viewer_rows[viewer_id] = row
+        else:
+            viewer_rows.pop(viewer_id, None)
+
+    gram.eliminate_zeros()
+    _cf_cache.update({"gram": gram.tocsr(), "movie_index": movie_index, "viewer_rows": viewer_rows})
+
+
+def _get_cf_cache():
+    version = ratings_version()
+    with _cache_lock:
+        local_version = _cf_cache["version"]
+
+        if _cf_cache["gram"] is None or local_version is None or local_version > version:
+            _ensure_cf_cache(version)
+        elif local_version < version:
+            changes = ratings_changes(local_version, version)
+            if changes is None or None in changes or len(set(changes)) > MAX_INCREMENTAL_CHANGES:
+                _ensure_cf_cache(version)
+            else:
+                _update_cf_viewers(list(dict.fromkeys(changes)))
+                _cf_cache["version"] = version
+        return dict(_cf_cache)
+
+
+def collaborative_preference(rated, movie_ids):
+    """
+    Скор совместных оценок для каждого фильма из movie_ids (в том же
+    порядке): косинусная схожесть с оценёнными фильмами, взвешенная
+    mood зрителя. None — если у оценок зрителя нет соседей.
+    """
+    cf = _get_cf_cache()
+    movie_index = cf["movie_index"]
+    size = len(movie_index)
+    if not size:
+        return None
+
+    gram = cf["gram"]
+    norms = np.sqrt(np.maximum(gram.diagonal(), 0.0))
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+    mood = np.zeros(size, dtype=np.float64)
+    for movie_id, score in rated.items():
+        col = movie_index.get(movie_id)
+        if col is not None:
+            mood[col] = _mood(score)
+    total_weight = np.abs(mood).sum()
+    if total_weight == 0:
+        return None
+
+    scores = inv_norms * (gram @ (inv_norms * mood)) / total_weight
+
+    cols = np.array([movie_index.get(movie_id, -1) for movie_id in movie_ids])
+    result = np.where(cols >= 0, scores[np.maximum(cols, 0)], 0.0)
+    unrated = np.array([movie_id not in rated for movie_id in movie_ids])
+    if not np.any(result[unrated]):
+        return None
+    return result.astype(np.float32)
+
+
 # ============================================================
 # === 4. Основная функция гибридных рекомендаций ==============
 # ============================================================
@@ -95,53 +712,181 @@ def hybrid_recommendations(viewer, limit=10):
        которые пользователь оценил высоко.
     2. Низкие оценки уменьшают вес схожих фильмов.
     3. Активность повышает вес фильмов, которые пользователь не оценил.
+
+    Схожесть берётся из заранее посчитанной матрицы, поэтому все
+    кандидаты оцениваются одним умножением матрицы на вектор.
+
+    Время и число запросов каждого этапа уходят в хуки
+    settings.RECOMMENDATION_TIMING_HOOKS (см. profiling.py).
     """
-    all_movies = list(Movie.objects.all())
-    ratings = Rating.objects.filter(viewer=viewer)
-    rated_movies = {r.movie: r.score for r in ratings}
-    scored = []
+    timer = StageTimer()
+    with timer.stage("catalog"):
+        movie_ids = list(Movie.objects.values_list('id', flat=True))
+    ranked = score_recommendations(viewer, movie_ids, limit, timer=timer)
+    with timer.stage("movies"):
+        # объекты фильмов грузим только для топа, а не для всего каталога
+        movies = Movie.objects.in_bulk([movie_id for movie_id, _ in ranked])
+    emit_timings(timer.timings())
+    return [movies[movie_id] for movie_id, _ in ranked if movie_id in movies]
 
-    for candidate in all_movies:
-        if candidate in rated_movies:
-            continue
 
-        total_weight = 0.0
-        sim_sum = 0.0
+def score_recommendations(viewer, movie_ids, limit=10, timer=NULL_TIMER):
+    """
+    Топ-limit пар (id фильма, скор) для зрителя среди movie_ids.
+    viewer может быть объектом или id — так пакетный пересчёт не
+    загружает самих зрителей.
+    """
+    if not movie_ids:
+        return []
+
+    with timer.stage("index"):
+        cache = _get_similarity_cache(movie_ids)
+        index = cache["index"]
+        rows = np.array([index[movie_id] for movie_id in movie_ids])
+
+    with timer.stage("ratings"):
+        ratings = Rating.objects.filter(viewer=viewer).values_list('movie_id', 'score')
+        rated = {movie_id: score for movie_id, score in ratings if movie_id in index}
+
+    # === 2. Активность — один запрос на все фильмы ===
+    with timer.stage("activity"):
+        activity = activity_scores(*activity_vectors(viewer, index))[rows]
 
-        # === 1. Сравнение с оценёнными фильмами ===
-        for rated_movie, score in rated_movies.items():
-            # шкала [-1, 1]: низкая оценка → -1, высокая → +1
-            mood = (score - 5) / 5.0
-            genre_sim = genre_similarity(rated_movie, candidate)
-            desc_sim = description_similarity(rated_movie, candidate)
+    # === 4. Если нет оценок — fallback ===
+    if not rated:
+        # новому зрителю — его активность вперемешку с тем, что смотрят сейчас
+        with timer.stage("trending"):
+            trend = trending_vector(index)[rows]
+        with timer.stage("ranking"):
+            return _top_movies(movie_ids, (1 - TRENDING_WEIGHT) * activity + TRENDING_WEIGHT * trend, limit)
 
-            # если низкая оценка — уменьшаем схожесть
-            base_sim = (genre_sim * 0.45 + desc_sim * 0.55) * mood
-            sim_sum += base_sim
-            total_weight += abs(mood)
+    # === 1. Сравнение с оценёнными фильмами ===
+    with timer.stage("similarity"):
+        # шкала [-1, 1]: низкая оценка → -1, высокая → +1
+        mood = np.zeros(len(cache["movie_ids"]), dtype=np.float32)
+        for movie_id, score in rated.items():
+            mood[index[movie_id]] = _mood(score)
 
-        # нормализация
+        # если низкая оценка — уменьшаем схожесть; нормализация по сумме |mood|
+        total_weight = float(np.abs(mood).sum())
         if total_weight > 0:
-            preference_score = sim_sum / total_weight
+            preference = _content_preference(cache, mood)[rows] / total_weight
         else:
-            preference_score = 0.0
+            preference = np.zeros(len(rows), dtype=np.float32)
 
-        # === 2. Добавляем влияние активности ===
-        activity_score = recent_activity_score(viewer, candidate)
+    with timer.stage("collaborative"):
+        # что оценили зрители с похожими оценками
+        collaborative = collaborative_preference(rated, movie_ids)
+        if collaborative is not None:
+            preference = (1 - COLLABORATIVE_WEIGHT) * preference + COLLABORATIVE_WEIGHT * collaborative
 
-        # === 3. Итоговый скор ===
+    # === 3. Итоговый скор ===
+    with timer.stage("ranking"):
         # Приоритет по описанию и жанрам (70%), активность (30%)
-        final_score = 0.7 * preference_score + 0.3 * activity_score
+        final = 0.7 * preference + 0.3 * activity
+        unrated = np.array([movie_id not in rated for movie_id in movie_ids])
+        candidates = [movie_id for movie_id in movie_ids if movie_id not in rated]
+        return _top_movies(candidates, final[unrated], limit)
 
-        scored.append((candidate, final_score))
 
-    # === 4. Если нет оценок — fallback ===
-    if not rated_movies:
-        scored = []
-        for movie in all_movies:
-            activity_score = recent_activity_score(viewer, movie)
-            scored.append((movie, activity_score))
+def _content_preference(cache, mood):
+    """Σ similarity[:, j] · mood[j] по всем оценённым фильмам j."""
+    if cache["similarity"] is not None:
+        return cache["similarity"] @ mood
+
+    # приближённый режим: жанры — только против оценённых фильмов (n × r),
+    # описания — только ANN_NEIGHBOURS ближайших соседей каждого из них
+    seeds = np.flatnonzero(mood)
+    genres = cache["genres"]
+    preference = GENRE_WEIGHT * (_genre_jaccard(genres, genres[seeds]) @ mood[seeds])
+    if cache["ann"] is not None:
+        desc = np.zeros_like(mood)
+        for seed in seeds:
+            rows, sims = cache["ann"].neighbours(seed, ANN_NEIGHBOURS)
+            desc[rows] += sims * mood[seed]
+        preference += DESCRIPTION_WEIGHT * desc
+    return preference
 
+
+def _top_movies(movie_ids, scores, limit):
     # === 5. Сортировка и результат ===
-    scored.sort(key=lambda x: x[1], reverse=True)
-    return [m for m, _ in scored[:limit]]
\ No newline at end of file
+    # стабильная сортировка: при равном скоре порядок как в каталоге
+    order = np.argsort(-scores, kind='stable')[:limit]
+    return [(movie_ids[i], float(scores[i])) for i in order]
+
+
+# ============================================================
+# === 6. Похожие фильмы: таблица топ-K соседей ===============
+# ============================================================
+# Для каждого фильма в MovieNeighbour лежат K самых похожих, так что
+# api/movie/<id>/similar/ — это один запрос по индексу, без sklearn.
+# При правке фильма пересчитываются только его список и списки тех
+# фильмов, куда он теперь попадает (или откуда выпадает).
+
+
+def _similarity_row(cache, row):
+    """Схожесть фильма в строке row со всем каталогом (без матрицы n × n)."""
+    if cache["similarity"] is not None:
+        return np.array(cache["similarity"][row], dtype=np.float32)
+    genres = cache["genres"]
+    sims = GENRE_WEIGHT * _genre_jaccard(genres, genres[[row]])[:, 0]
+    if cache["matrix"] is not None:
+        matrix = cache["matrix"]
+        sims = sims + DESCRIPTION_WEIGHT * np.asarray((matrix @ matrix[row].T).todense()).ravel()
+    return sims.astype(np.float32)
+
+
+def _top_neighbours(cache, row, k):
+    sims = _similarity_row(cache, row)
+    sims[row] = -np.inf
+    order = np.argsort(-sims, kind='stable')[:k]
+    movie_ids = cache["movie_ids"]
+    return [(movie_ids[i], float(sims[i])) for i in order if sims[i] > 0]
+
+
+def refresh_movie_neighbours(movie_ids=None, k=SIMILAR_MOVIES_K, affected=()):
+    """
+    Пересчитывает таблицу соседей: целиком (movie_ids=None) или только
+    списки, которые могли измениться из-за правки movie_ids. affected —
+    фильмы, чьи списки точно надо пересчитать (например, из них только
+    что каскадно удалили соседа).
+    """
+    cache = _get_similarity_cache()
+    index = cache["index"]
+
+    if movie_ids is None:
+        targets = set(index)
+    else:
+        changed = [m for m in movie_ids if m in index]
+        targets = set(changed) | set(affected)
+        # фильм был соседом — его место в чужом списке могло измениться
+        targets.update(
+            MovieNeighbour.objects.filter(neighbour_id__in=movie_ids)
+            .values_list('movie_id', flat=True)
+        )
+        # таблицу могли строить с другим K (build_movie_neighbours -k): длина
+        # самых длинных списков — нижняя граница K, меньшую не берём
+        k = max(MovieNeighbour.objects.aggregate(k=Max('rank'))['k'] or 0, k)
+        # порог попадания в чужой список — скор K-го соседа (или 0, если список короче)
+        threshold = np.zeros(len(cache["movie_ids"]), dtype=np.float32)
+        for movie_id, score in MovieNeighbour.objects.filter(rank=k).values_list('movie_id', 'score'):
+            if movie_id in index:
+                threshold[index[movie_id]] = score
+        for movie_id in changed:
+            sims = _similarity_row(cache, index[movie_id])
+            for row in np.flatnonzero(sims > threshold):
+                targets.add(cache["movie_ids"][row])
+        targets &= set(index)
+
+    rows = [
+        MovieNeighbour(movie_id=movie_id, neighbour_id=neighbour_id, rank=rank, score=score)
+        for movie_id in targets
+        for rank, (neighbour_id, score) in enumerate(_top_neighbours(cache, index[movie_id], k), start=1)
+    ]
+    with transaction.atomic():
+        if movie_ids is None:
+            MovieNeighbour.objects.all().delete()
+        else:
+            MovieNeighbour.objects.filter(movie_id__in=targets).delete()
+        MovieNeighbour.objects.bulk_create(rows, batch_size=1000)
+    return len(targets)
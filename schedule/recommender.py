@@ -0,0 +1,246 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import F
+
+from .models import Viewer, ViewerRecommendation
+from .signals import catalog_version, version_expression
+
+logger = logging.getLogger('schedule.recommendations')
+
+# ============================================================
+# === Лёгкий фасад движка рекомендаций =======================
+# ============================================================
+# schedule.recommendations тянет за собой sklearn, scipy и numpy —
+# это сотни миллисекунд и десятки мегабайт на каждый процесс. Вьюхи
+# и сигналы работают только через этот модуль, а сам движок
+# импортируется при первом реальном расчёте. Процессы, которые
+# ничего не рекомендуют (migrate, админка, воркеры на попаданиях в
+# кэш), ML-стек не загружают вовсе. Зависимость односторонняя: движок
+# фасад не импортирует.
+
+# Сколько соседей хранится для каждого фильма в MovieNeighbour. Живёт
+# в настройках, а не здесь, чтобы движок брал его без импорта фасада.
+SIMILAR_MOVIES_K = getattr(settings, 'RECOMMENDATION_SIMILAR_MOVIES_K', 20)
+
+
+def engine():
+    """Модуль schedule.recommendations; импортируется при первом вызове."""
+    return import_module('.recommendations', __package__)
+
+
+def hybrid_recommendations(viewer, limit=10):
+    return engine().hybrid_recommendations(viewer, limit=limit)
+
+
+def refresh_movie_neighbours(movie_ids=None, k=SIMILAR_MOVIES_K, affected=()):
+    return engine().refresh_movie_neighbours(movie_ids, k=k, affected=affected)
+
+
+# ============================================================
+# === Кэш готовых рекомендаций зрителя =======================
+# ============================================================
+# Один ключ на зрителя: внутри версия каталога, штамп зрителя
+# (Viewer.recommendations_version) и списки по limit. Сброс — когда
+# зритель оценивает фильм, добавляет закладку или меняется его
+# активность — увеличивает штамп в БД; запись с другой версией или
+# штампом устарела сама по себе. Так фоновый расчёт, начатый до
+# сброса, не вернёт старый список в кэш, даже если допишет его позже,
+# и сброс через один воркер виден остальным. При промахе сначала берём ночной расчёт
+# из ViewerRecommendation (manage.py precompute_recommendations),
+# и только потом будим движок; если ночных строк меньше limit, список
+# добирается живым расчётом.
+#
+# Сброс не удаляет ночные строки, а помечает их is_stale: вкусы
+# зрителя изменились, поэтому синхронный путь их пропускает, а
+# recommendations_snapshot отдаёт как временный список, пока свежий
+# считается в фоне. Следующий прогон команды пишет строки заново.
+VIEWER_RECOMMENDATIONS_KEY = "recommendations:viewer:{}"
+
+
+def _recommendations_cache():
+    return caches['recommendations' if 'recommendations' in settings.CACHES else 'default']
+
+
+def _stamps(viewer_id):
+    """(версия каталога, штамп зрителя) — одним запросом."""
+    row = (
+        Viewer.objects.filter(pk=viewer_id)
+        .values_list(version_expression("catalog"), 'recommendations_version')
+        .first()
+    )
+    return row or (catalog_version(), 0)
+
+
+def _is_current(entry, stamps):
+    return entry is not None and (entry["version"], entry.get("stamp")) == stamps
+
+
+def cached_recommendations(viewer, limit=10):
+    cache = _recommendations_cache()
+    key = VIEWER_RECOMMENDATIONS_KEY.format(viewer.id)
+    stamps = _stamps(viewer.id)
+
+    entry = cache.get(key)
+    if not _is_current(entry, stamps):
+        entry = {"version": stamps[0], "stamp": stamps[1], "results": {}}
+    elif limit in entry["results"]:
+        return entry["results"][limit]
+
+    movies = precomputed_recommendations(viewer, limit)
+    if len(movies) < limit:
+        movies += [
+            movie for movie in hybrid_recommendations(viewer, limit=limit) if movie not in movies
+        ][:limit - len(movies)]
+    entry["results"][limit] = movies
+    # пока считали, зрителя могли сбросить — такой список в кэш не кладём
+    if _stamps(viewer.id)[1] == stamps[1]:
+        cache.set(key, entry)
+    return movies
+
+
+def _precomputed(viewer, limit):
+    return list(
+        ViewerRecommendation.objects
+        .filter(viewer=viewer)
+        .select_related('movie')
+        .order_by('rank')[:limit]
+    )
+
+
+def precomputed_recommendations(viewer, limit=10):
+    return [rec.movie for rec in _precomputed(viewer, limit) if not rec.is_stale]
+
+
+def invalidate_recommendations(viewer):
+    Viewer.objects.filter(pk=viewer.pk).update(recommendations_version=F('recommendations_version') + 1)
+    _recommendations_cache().delete(VIEWER_RECOMMENDATIONS_KEY.format(viewer.id))
+    # ночной расчёт больше не отражает вкусы зрителя — но остаётся до следующего прогона
+    ViewerRecommendation.objects.filter(viewer=viewer, is_stale=False).update(is_stale=True)
+
+
+def recommendations_snapshot(viewer, limit=10):
+    """
+    То, что можно отдать прямо сейчас, без расчёта: (movies, pending).
+    Устаревший список отдаётся как есть, а свежий считается в фоне;
+    pending=True — клиенту стоит спросить ещё раз позже.
+    """
+    cache = _recommendations_cache()
+    entry = cache.get(VIEWER_RECOMMENDATIONS_KEY.format(viewer.id))
+    stamps = _stamps(viewer.id)
+
+    if entry is not None and limit in entry["results"]:
+        if _is_current(entry, stamps):
+            return entry["results"][limit], False
+        return entry["results"][limit], refresh_in_background(viewer.id, limit)
+
+    recs = _precomputed(viewer, limit)
+    movies = [rec.movie for rec in recs]
+    if len(movies) == limit and not any(rec.is_stale for rec in recs):
+        if not _is_current(entry, stamps):
+            entry = {"version": stamps[0], "stamp": stamps[1], "results": {}}
+        entry["results"][limit] = movies
+        cache.set(VIEWER_RECOMMENDATIONS_KEY.format(viewer.id), entry)
+        return movies, False
+    # устаревший или неполный ночной список — временно, свежий считаем в фоне
+    return movies or None, refresh_in_background(viewer.id, limit)
+
+
+# ============================================================
+# === Фоновый пересчёт =======================================
+# ============================================================
+# Небольшой пул потоков внутри воркера. Один и тот же зритель не
+# ставится в очередь дважды: повторные запросы, пока расчёт идёт,
+# просто ждут его результата в кэше. Очередь ограничена — при
+# перегрузке новые задачи отклоняются, а не копятся в памяти.
+# Сюда же сигналы отправляют пересчёт таблицы соседей после правки
+# каталога, чтобы сохранение фильма не ждало numpy.
+# RECOMMENDATION_WORKERS = 0 — без пула: всё считается сразу в
+# вызывающем потоке (тесты, отладка).
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _inline():
+    return not getattr(settings, 'RECOMMENDATION_WORKERS', 2)
+
+
+def _get_executor():
+    global _executor
+    with _pending_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RECOMMENDATION_WORKERS', 2),
+                thread_name_prefix='recommendations',
+            )
+    return _executor
+
+
+def refresh_in_background(viewer_id, limit=10):
+    """
+    Ставит пересчёт в очередь. True — задача стоит в очереди (новая
+    или уже была), False — очередь заполнена.
+    """
+    if _inline():
+        viewer = Viewer.objects.filter(id=viewer_id).first()
+        if viewer is not None:
+            cached_recommendations(viewer, limit)
+        return True
+
+    key = (viewer_id, limit)
+    with _pending_lock:
+        if key in _pending:
+            return True
+        if len(_pending) >= getattr(settings, 'RECOMMENDATION_QUEUE_SIZE', 100):
+            return False
+        _pending.add(key)
+
+    executor = _get_executor()
+    try:
+        executor.submit(_refresh, viewer_id, limit)
+    except RuntimeError:
+        # пул уже остановлен (завершение процесса)
+        with _pending_lock:
+            _pending.discard(key)
+        return False
+    return True
+
+
+def _refresh(viewer_id, limit):
+    try:
+        viewer = Viewer.objects.filter(id=viewer_id).first()
+        if viewer is not None:
+            cached_recommendations(viewer, limit)
+    finally:
+        with _pending_lock:
+            _pending.discard((viewer_id, limit))
+        # у каждого потока своё соединение с БД — не оставляем его висеть
+        connections.close_all()
+
+
+def refresh_neighbours_in_background(movie_ids=None, affected=()):
+    """Ставит пересчёт MovieNeighbour в пул (см. refresh_movie_neighbours)."""
+    if _inline():
+        refresh_movie_neighbours(movie_ids, affected=affected)
+        return
+    try:
+        _get_executor().submit(_refresh_neighbours, movie_ids, affected)
+    except RuntimeError:
+        # пул уже остановлен — досчитываем здесь, чтобы таблица не отстала
+        refresh_movie_neighbours(movie_ids, affected=affected)
+
+
+def _refresh_neighbours(movie_ids, affected):
+    try:
+        refresh_movie_neighbours(movie_ids, affected=affected)
+    except Exception:
+        # исключение в пуле никто не увидит; таблицу починит build_movie_neighbours
+        logger.exception("refresh_movie_neighbours(%r) failed", movie_ids)
+    finally:
+        connections.close_all()
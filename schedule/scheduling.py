@@ -0,0 +1,202 @@
+import csv
+import json
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Hall, Movie, Session
+
+
+# ===== 📅 Пакетне планування сеансів =====
+# Розклад (фільм, зал, час, ціна) з CSV або JSONL перевіряється цілком
+# і вставляється пачками bulk_create: фільми й зали — двома запитами,
+# перетини в залах — одним запитом по інтервалу дат, далі INSERT на
+# кожні batch_size сеансів. Місця окремо не створюються: зайнятість
+# живе в бітовій карті сеансу (див. schedule/seating.py).
+#
+# Тривалості фільмів у моделі немає, тому сеанс займає зал на SESSION_SLOT
+# (фільм + прибирання); два сеанси в одному залі конфліктують, якщо їх
+# початки ближчі за слот.
+SESSION_SLOT = timedelta(hours=3)
+SCHEDULE_BATCH_SIZE = 1000
+
+
+class ScheduleError(Exception):
+    """Розклад не пройшов перевірку; errors — список «рядок N: що не так»."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(errors))
+
+
+def read_schedule(stream, fmt):
+    """
+    Рядки розкладу з файлу: fmt 'csv' (із заголовком) або 'jsonl'.
+    Рядки JSONL, що не є JSON-об'єктом, — ScheduleError з номерами рядків
+    (нумерація та сама, що й у plan_sessions: порожні рядки не рахуються).
+    """
+    if fmt == "csv":
+        return list(csv.DictReader(stream))
+    if fmt != "jsonl":
+        raise ValueError(f"Невідомий формат розкладу: {fmt}")
+
+    rows, errors = [], []
+    for line, text in enumerate((text for text in stream if text.strip()), start=1):
+        try:
+            row = json.loads(text)
+        except json.JSONDecodeError as e:
+            errors.append(f"рядок {line}: некоректний JSON ({e.msg})")
+            continue
+        if not isinstance(row, dict):
+            errors.append(f"рядок {line}: очікується JSON-об'єкт")
+            continue
+        rows.append(row)
+    if errors:
+        raise ScheduleError(errors)
+    return rows
+
+
+# назва збігається з кількома об'єктами — треба вказати id
+AMBIGUOUS = (None,)
+
+
+def _lookup(model, field, refs, *extra):
+    """
+    {посилання: (id, *extra)} для посилань на об'єкти через id або field —
+    одним запитом. Число — спершу id, потім назва (фільм «1917»); назва,
+    під якою кілька об'єктів, — AMBIGUOUS замість id.
+    """
+    refs = {str(ref) for ref in refs}
+    ids = [int(ref) for ref in refs if ref.isdigit()]
+    matches = model.objects.filter(Q(pk__in=ids) | Q(**{f"{field}__in": refs}))
+    by_pk, by_name = {}, {}
+    for pk, name, *values in matches.values_list('pk', field, *extra):
+        by_pk[str(pk)] = (pk, *values)
+        by_name.setdefault(name, []).append((pk, *values))
+
+    found = {}
+    for ref in refs:
+        if ref in by_pk:
+            found[ref] = by_pk[ref]
+        elif ref in by_name:
+            found[ref] = by_name[ref][0] if len(by_name[ref]) == 1 else AMBIGUOUS
+    return found
+
+
+def _parse_datetime(value):
+    try:
+        moment = parse_datetime(str(value).strip())
+    except ValueError:
+        # формат правильний, але такої дати немає (2025-02-30)
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _parse_price(value, default):
+    """
+    Ціна сеансу як Decimal або None, якщо вона не вміщується в Session.price:
+    bulk_create поле не перевіряє, а завелике значення потім не прочитати з БД.
+    0 — безкоштовний сеанс; ціна за замовчуванням лише для порожньої.
+    """
+    field = Session._meta.get_field('price')
+    value = default if value is None or str(value).strip() == "" else str(value).strip()
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        return None
+    step = Decimal(1).scaleb(-field.decimal_places)
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+    # копійки не округлюємо мовчки: 12.345 — помилка, 12.340 — ні
+    if not price.is_finite() or not 0 <= price < limit or price != price.quantize(step):
+        return None
+    return price.quantize(step)
+
+
+def plan_sessions(rows, slot=SESSION_SLOT):
+    """
+    Перевіряє розклад і повертає незбережені Session. Помилки всіх
+    рядків збираються разом — ScheduleError, якщо є хоч одна.
+    """
+    default_price = Session._meta.get_field('price').default
+    movies = _lookup(Movie, 'title', {str(row.get("movie", "")).strip() for row in rows})
+    halls = _lookup(Hall, 'name', {str(row.get("hall", "")).strip() for row in rows}, 'rows', 'seats_per_row')
+
+    errors, sessions = [], []
+    for line, row in enumerate(rows, start=1):
+        movie = movies.get(str(row.get("movie", "")).strip())
+        hall = halls.get(str(row.get("hall", "")).strip())
+        movie_id, *_ = movie or (None,)
+        hall_id, *size = hall or (None,)
+        moment = _parse_datetime(row.get("datetime", ""))
+        price = _parse_price(row.get("price"), default_price)
+        problems = [
+            message for message, bad in (
+                (f"кілька фільмів з назвою {row.get('movie')!r}, вкажіть id", movie is AMBIGUOUS),
+                (f"невідомий фільм {row.get('movie')!r}", movie is None),
+                (f"кілька залів з назвою {row.get('hall')!r}, вкажіть id", hall is AMBIGUOUS),
+                (f"невідомий зал {row.get('hall')!r}", hall is None),
+                (f"некоректний час {row.get('datetime')!r}", moment is None),
+                (f"некоректна ціна {row.get('price')!r}", price is None),
+            ) if bad
+        ]
+        if problems:
+            errors.append(f"рядок {line}: {', '.join(problems)}")
+            continue
+        # bulk_create минає Session.save, тож місця залу рахуємо тут
+        session = Session(
+            movie_id=movie_id, hall_id=hall_id, datetime=moment, price=price, seats_total=size[0] * size[1]
+        )
+        session.line = line
+        sessions.append(session)
+
+    if sessions:
+        errors.extend(_overlaps(sessions, slot))
+    if errors:
+        raise ScheduleError(errors)
+    return sessions
+
+
+def _overlaps(sessions, slot):
+    """
+    Перетини нових сеансів між собою та з уже запланованими. Існуючі
+    сеанси тих самих залів беремо одним запитом за весь інтервал розкладу,
+    далі — один прохід по відсортованих початках кожного залу.
+    """
+    start = min(session.datetime for session in sessions) - slot
+    end = max(session.datetime for session in sessions) + slot
+    existing = Session.objects.filter(
+        hall_id__in={session.hall_id for session in sessions},
+        datetime__gt=start,
+        datetime__lt=end,
+    ).values_list('hall_id', 'datetime')
+
+    timeline = [(hall_id, moment, None) for hall_id, moment in existing]
+    timeline += [(session.hall_id, session.datetime, session.line) for session in sessions]
+    timeline.sort(key=lambda item: (item[0], item[1]))
+
+    errors = []
+    for hall_id, items in groupby(timeline, key=lambda item: item[0]):
+        previous = None
+        for item in items:
+            if previous is not None and item[1] - previous[1] < slot and (item[2] or previous[2]):
+                line = item[2] or previous[2]
+                other = f"рядком {previous[2]}" if item[2] and previous[2] else "існуючим сеансом"
+                errors.append(
+                    f"рядок {line}: зал {hall_id} о {item[1]:%Y-%m-%d %H:%M} перетинається з {other}"
+                )
+            previous = item
+    return errors
+
+
+def schedule_sessions(rows, slot=SESSION_SLOT, batch_size=SCHEDULE_BATCH_SIZE):
+    """Перевіряє і зберігає розклад: усе або нічого, INSERT пачками по batch_size."""
+    sessions = plan_sessions(rows, slot)
+    with transaction.atomic():
+        return Session.objects.bulk_create(sessions, batch_size=batch_size)
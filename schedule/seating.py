@@ -0,0 +1,491 @@
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .ledger import InsufficientFunds, debit
+from .models import Seat, Session
+
+
+# ===== 💺 Карта місць сеансу =====
+# Зайнятість зберігається в самому сеансі (Session.seat_map) як бітова
+# карта: біт (row - 1) * seats_per_row + (column - 1), рядок за рядком.
+# Порожня карта — усі місця вільні, тому новий сеанс не створює жодного
+# рядка Seat. Таблиця Seat тепер містить лише продані місця (хто і де
+# сидить), і її розмір залежить від кількості квитків, а не від залу.
+
+
+class SeatMap:
+    def __init__(self, rows, seats_per_row, data=b""):
+        self.rows = rows
+        self.seats_per_row = seats_per_row
+        size = (rows * seats_per_row + 7) // 8
+        # зал могли змінити після продажу — обрізаємо або доповнюємо нулями
+        self.bits = bytearray(bytes(data or b"")[:size].ljust(size, b"\0"))
+
+    @classmethod
+    def for_session(cls, session):
+        return cls(session.hall.rows, session.hall.seats_per_row, session.seat_map)
+
+    def contains(self, row, column):
+        return 1 <= row <= self.rows and 1 <= column <= self.seats_per_row
+
+    def _bit(self, row, column):
+        if not self.contains(row, column):
+            raise ValueError(f"Місця ({row}, {column}) немає в залі")
+        index = (row - 1) * self.seats_per_row + (column - 1)
+        return index >> 3, 1 << (index & 7)
+
+    def is_taken(self, row, column):
+        byte, mask = self._bit(row, column)
+        return bool(self.bits[byte] & mask)
+
+    def take(self, row, column):
+        byte, mask = self._bit(row, column)
+        self.bits[byte] |= mask
+
+    def release(self, row, column):
+        byte, mask = self._bit(row, column)
+        self.bits[byte] &= ~mask & 0xFF
+
+    @property
+    def total(self):
+        return self.rows * self.seats_per_row
+
+    @property
+    def sold(self):
+        return sum(bin(byte).count("1") for byte in self.bits)
+
+    def grid(self):
+        """Рядки залу: [[(column, taken), ...], ...]."""
+        return [
+            [(column, self.is_taken(row, column)) for column in range(1, self.seats_per_row + 1)]
+            for row in range(1, self.rows + 1)
+        ]
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    def availability(self):
+        """Рядок row-major: '0' — вільно, '1' — продано."""
+        return "".join(
+            "1" if self.bits[i >> 3] & (1 << (i & 7)) else "0"
+            for i in range(self.total)
+        )
+
+
+# ===== Кешована карта для api/session/<id>/seats/ =====
+# Кожен продаж чи повернення збільшує Session.seat_map_version тим самим
+# UPDATE, що пише карту; карта кешується під ключем з версією, а версія
+# ж є ETag. Версія живе в БД, а не в кеші, тож у всіх воркерів вона
+# однакова навіть з окремим кешем у кожного. Клієнт, що опитує карту,
+# майже завжди отримує 304 за один запит по первинному ключу.
+SEAT_MAP_KEY = "seats:{}:map:{}"
+SEAT_MAP_TTL = 60 * 60
+
+
+def seat_map_version(session_id):
+    """Поточна версія карти сеансу; None — такого сеансу немає."""
+    return Session.objects.filter(pk=session_id).values_list('seat_map_version', flat=True).first()
+
+
+def seat_map_payload(session_id, version=None, holds=None):
+    """
+    Компактна карта сеансу для клієнта: '0' вільно, '1' продано,
+    '2' утримується на оплаті. None — такого сеансу немає. version і
+    holds можна передати вже прочитаними (як для ETag), щоб не читати їх
+    удруге.
+    """
+    if version is None:
+        version = seat_map_version(session_id)
+        if version is None:
+            return None
+    key = SEAT_MAP_KEY.format(session_id, version)
+    payload = cache.get(key)
+    if payload is None:
+        session = Session.objects.select_related('hall').filter(pk=session_id).first()
+        if session is None:
+            return None
+        seat_map = SeatMap.for_session(session)
+        payload = {
+            "session": session_id,
+            "version": version,
+            "rows": seat_map.rows,
+            "seats_per_row": seat_map.seats_per_row,
+            "seats": seat_map.availability(),
+            "sold": seat_map.sold,
+        }
+        cache.set(key, payload, SEAT_MAP_TTL)
+    return _with_holds(payload, active_holds(session_id) if holds is None else holds)
+
+
+class SeatTaken(Exception):
+    pass
+
+
+class SeatHeld(SeatTaken):
+    """Місце не продане, але його зараз оформлює інший глядач."""
+
+
+class HoldsBusy(SeatHeld):
+    """Реєстр утримань сеансу не вдалося заблокувати — спробувати ще раз."""
+
+
+# ===== Тимчасове утримання місць на час оплати =====
+# Поки глядач на сторінці оплати, місце утримується ключем у кеші:
+# cache.add атомарний, тож утримати місце може лише один. Кеш за
+# замовчуванням спільний для всіх воркерів (БД або Redis, див.
+# CACHES у settings) — у кеші окремого процесу утримання з іншого
+# воркера не було б видно. Ключ живе SEAT_HOLD_TTL і зникає сам, якщо
+# вкладку просто закрили; таблиці квитків до покупки не змінюються. Окремий реєстр сеансу {(row, column):
+# (viewer_id, expires)} потрібен для показу на карті, масового
+# звільнення і ліміту: глядач утримує на сеансі не більше GROUP_MAX_SEATS
+# місць. Хто утримує конкретне місце, вирішують ключі місць.
+SEAT_HOLD_KEY = "seats:{}:hold:{}:{}"
+SEAT_HOLDS_KEY = "seats:{}:holds"
+SEAT_HOLDS_LOCK_KEY = "seats:{}:holds:lock"
+SEAT_HOLD_TTL = 5 * 60
+
+
+def _hold_key(session_id, row, column):
+    return SEAT_HOLD_KEY.format(session_id, row, column)
+
+
+@contextmanager
+def _holds_registry(session_id):
+    """Реєстр утримань сеансу на зміну; короткий замок теж через cache.add."""
+    lock = SEAT_HOLDS_LOCK_KEY.format(session_id)
+    for _ in range(50):
+        if cache.add(lock, 1, timeout=5):
+            break
+        time.sleep(0.01)
+    else:
+        # без замка записали б реєстр поверх чужого і загубили утримання
+        raise HoldsBusy()
+    try:
+        key = SEAT_HOLDS_KEY.format(session_id)
+        now = time.time()
+        registry = {seat: entry for seat, entry in (cache.get(key) or {}).items() if entry[1] > now}
+        yield registry
+        cache.set(key, registry, SEAT_HOLD_TTL)
+    finally:
+        cache.delete(lock)
+
+
+def active_holds(session_id):
+    """{(row, column): viewer_id} — утримання, що ще не сплили."""
+    now = time.time()
+    registry = cache.get(SEAT_HOLDS_KEY.format(session_id)) or {}
+    return {seat: viewer_id for seat, (viewer_id, expires) in registry.items() if expires > now}
+
+
+def holds_signature(holds):
+    """Короткий відбиток утримань (active_holds) для ETag карти місць."""
+    return zlib.crc32(repr(sorted(holds)).encode())
+
+
+def _with_holds(payload, holds):
+    seats = list(payload["seats"])
+    columns = payload["seats_per_row"]
+    for row, column in holds:
+        index = (row - 1) * columns + (column - 1)
+        if 0 <= index < len(seats) and seats[index] == "0":
+            seats[index] = "2"
+    return {**payload, "seats": "".join(seats), "held": seats.count("2")}
+
+
+def hold_seats(session_id, seats, viewer_id, replace=False):
+    """
+    Утримує місця [(row, column), ...] за глядачем «все або нічого» і
+    повертає час закінчення (epoch). Власні утримання подовжуються;
+    replace=True — решта утримань глядача на сеансі звільняється.
+    SeatHeld(місця) — частину вже утримує хтось інший; ValueError —
+    разом глядач утримував би більше GROUP_MAX_SEATS місць.
+    """
+    seats = [(int(row), int(column)) for row, column in seats]
+    expires = time.time() + SEAT_HOLD_TTL
+    with _holds_registry(session_id) as registry:
+        mine = {seat for seat, (owner, _) in registry.items() if owner == viewer_id}
+        previous = mine - set(seats) if replace else set()
+        if len((mine - previous) | set(seats)) > GROUP_MAX_SEATS:
+            raise ValueError(f"Утримати можна не більше {GROUP_MAX_SEATS} місць на сеанс")
+
+        added, conflicts = [], []
+        for row, column in seats:
+            key = _hold_key(session_id, row, column)
+            if cache.add(key, viewer_id, SEAT_HOLD_TTL):
+                added.append(key)
+            elif (row, column) not in registry:
+                # ключ пережив своє утримання (кеш у БД рахує TTL з точністю
+                # до секунди), а реєстр під замком уже знає, що місце вільне
+                cache.set(key, viewer_id, SEAT_HOLD_TTL)
+                added.append(key)
+            elif cache.get(key) == viewer_id:
+                cache.set(key, viewer_id, SEAT_HOLD_TTL)
+            else:
+                conflicts.append((row, column))
+        if conflicts:
+            cache.delete_many(added)
+            raise SeatHeld(conflicts)
+
+        for seat in seats:
+            registry[seat] = (viewer_id, expires)
+        _drop_holds(registry, session_id, viewer_id, previous)
+    return expires
+
+
+def release_holds(session_id, viewer_id, seats=None):
+    """
+    Звільняє утримання глядача на сеансі — усі (покинута оплата) або
+    лише вказані місця (після покупки). Повертає кількість звільнених.
+    """
+    with _holds_registry(session_id) as registry:
+        if seats is None:
+            seats = {seat for seat, (owner, _) in registry.items() if owner == viewer_id}
+        return _drop_holds(registry, session_id, viewer_id, seats)
+
+
+def _drop_holds(registry, session_id, viewer_id, seats):
+    keys = {_hold_key(session_id, row, column): (row, column) for row, column in seats}
+    mine = [key for key, owner in cache.get_many(list(keys)).items() if owner == viewer_id]
+    cache.delete_many(mine)
+    for seat in seats:
+        if registry.get(seat, (None,))[0] == viewer_id:
+            del registry[seat]
+    return len(mine)
+
+
+def _check_holds(session_id, seats, viewer_id):
+    keys = {_hold_key(session_id, row, column): (row, column) for row, column in seats}
+    held = [keys[key] for key, owner in cache.get_many(list(keys)).items() if owner != viewer_id]
+    if held:
+        raise SeatHeld(held)
+
+
+# ===== Автовибір найкращих місць поруч =====
+# Карта сеансу вже лежить у рядку Session, тож зайнятість — це один
+# запит плюс утримання з кешу. Далі один прохід по рядках: у кожному
+# рахуємо довжину поточної серії вільних місць, і кожна серія довжиною
+# ≥ party дає кандидата. Кращий — ближчий до центру ряду та до
+# «золотого» ряду залу; усе разом O(rows × seats_per_row).
+PREFERRED_ROW_SHARE = 0.5   # 0 — перший ряд, 1 — останній
+ROW_WEIGHT = 1.0            # наскільки ряд важливіший за зсув від центру
+
+
+def best_block(occupancy, rows, seats_per_row, party):
+    """
+    Найкращі party місць поспіль [(row, column), ...] або None.
+    occupancy — рядок row-major, де '0' означає вільне місце.
+    """
+    if party < 1 or party > seats_per_row:
+        return None
+    center = (seats_per_row + 1) / 2
+    preferred = 1 + (rows - 1) * PREFERRED_ROW_SHARE
+    best, best_score = None, None
+    # ряди від «золотого» до крайніх: щойно штраф ряду перевищить
+    # найкращий бал, далі шукати марно
+    for row in sorted(range(1, rows + 1), key=lambda row: abs(row - preferred)):
+        offset = (row - 1) * seats_per_row
+        row_penalty = ROW_WEIGHT * abs(row - preferred) / rows
+        if best_score is not None and row_penalty >= best_score:
+            break
+        run = 0
+        for column in range(1, seats_per_row + 1):
+            run = run + 1 if occupancy[offset + column - 1] == "0" else 0
+            if run >= party:
+                start = column - party + 1
+                score = row_penalty + abs((start + column) / 2 - center) / seats_per_row
+                if best_score is None or score < best_score:
+                    best, best_score = (row, start), score
+    if best is None:
+        return None
+    row, start = best
+    return [(row, column) for column in range(start, start + party)]
+
+
+def pick_seats(session, party, viewer_id=None):
+    """
+    Найкращий вільний блок на сеансі; місця, утримані іншими глядачами,
+    пропускаються (власні утримання глядача вважаються вільними).
+    """
+    seat_map = SeatMap.for_session(session)
+    holds = {seat for seat, owner in active_holds(session.pk).items() if owner != viewer_id}
+    occupancy = _with_holds(
+        {"seats": seat_map.availability(), "seats_per_row": seat_map.seats_per_row}, holds
+    )["seats"]
+    return best_block(occupancy, seat_map.rows, seat_map.seats_per_row, party)
+
+
+# ===== Продаж місць під конкуренцією =====
+# Місце «захоплює» сам INSERT у Seat: унікальний (session, row, column)
+# пропускає лише одного покупця, решта одразу отримують SeatTaken —
+# без блокування сеансу на весь час оплати. Гроші списує ledger.debit
+# умовним UPDATE balance = balance - ціна WHERE balance >= ціна, тож
+# паралельні покупки не гублять списань. Біт у карті сеансу ставиться останнім
+# кроком через compare-and-swap: рядок сеансу блокується лише на мить
+# перед COMMIT.
+SEAT_MAP_RETRIES = 5
+
+
+def _claim_seat(session, row, column, viewer_id):
+    seat = Seat(session=session, row=row, column=column, viewer_id=viewer_id)
+    # карту оновлюємо тут же, сигнал її не перебудовує
+    seat._seat_map_synced = True
+    try:
+        with transaction.atomic():
+            seat.save(force_insert=True)
+    except IntegrityError:
+        raise SeatTaken()
+    return seat
+
+
+def _seat_map_fields(seat_map):
+    # лічильники і версія пишуться разом із картою — окремого UPDATE чи COUNT не треба
+    return {
+        "seat_map": seat_map.to_bytes(), "seats_sold": seat_map.sold, "seats_total": seat_map.total,
+        "seat_map_version": F("seat_map_version") + 1,
+    }
+
+
+def _update_seat_map(session_id, change):
+    """
+    Застосовує change(seat_map) до карти сеансу через CAS:
+    UPDATE ... WHERE seat_map = <прочитана>. Якщо карту встиг змінити
+    інший продаж — перечитуємо і пробуємо ще.
+    """
+    for _ in range(SEAT_MAP_RETRIES):
+        session = Session.objects.select_related('hall').only(
+            'seat_map', 'hall__rows', 'hall__seats_per_row'
+        ).get(pk=session_id)
+        current = bytes(session.seat_map)
+        seat_map = SeatMap.for_session(session)
+        change(seat_map)
+        if Session.objects.filter(pk=session_id, seat_map=current).update(**_seat_map_fields(seat_map)):
+            return seat_map
+    # дуже гаряча карта — збираємо з Seat (у транзакції видно і наш рядок)
+    return rebuild_seat_map(session_id)
+
+
+def sell_seat(session, row, column, viewer):
+    """
+    Продає одне місце без оплати: рядок у Seat і біт у карті сеансу — в
+    одній транзакції. SeatTaken — місце вже зайняте.
+    """
+    if SeatMap.for_session(session).is_taken(row, column):
+        raise SeatTaken()
+    _check_holds(session.pk, [(row, column)], viewer.pk)
+    with transaction.atomic():
+        seat = _claim_seat(session, row, column, viewer.pk)
+        _update_seat_map(session.pk, lambda seat_map: seat_map.take(row, column))
+    return seat
+
+
+def buy_ticket(session, row, column, wallet):
+    """
+    Місце для власника гаманця + оплата + запис в історії однією
+    транзакцією. SeatTaken / InsufficientFunds — нічого не змінено.
+    """
+    return buy_tickets(session, [(row, column)], wallet)[0]
+
+
+# ===== Групове бронювання =====
+# Уся група — один bulk INSERT у Seat: якщо хоч одне місце вже продане,
+# унікальний індекс відхиляє весь INSERT і не захоплено жодного. Далі
+# одне списання за всю суму, одна Transaction з позиціями і одна зміна
+# карти. Кількість запитів не залежить від розміру групи.
+GROUP_MAX_SEATS = 10
+
+
+def buy_tickets(session, seats, wallet):
+    """
+    Купує кілька місць [(row, column), ...] одного сеансу «все або
+    нічого». ValueError — порожній, завеликий список, повтори чи місця
+    поза залом; SeatTaken(зайняті) / SeatHeld(утримані іншими) /
+    InsufficientFunds — нічого не змінено.
+    session має прийти з select_related('movie', 'hall').
+    """
+    seats = [(int(row), int(column)) for row, column in seats]
+    if not seats:
+        raise ValueError("Не вибрано жодного місця")
+    if len(seats) > GROUP_MAX_SEATS:
+        raise ValueError(f"За раз можна купити не більше {GROUP_MAX_SEATS} місць")
+    if len(set(seats)) != len(seats):
+        raise ValueError("Місця повторюються")
+
+    seat_map = SeatMap.for_session(session)
+    if not all(seat_map.contains(row, column) for row, column in seats):
+        raise ValueError("Деяких місць немає в залі")
+    taken = [(row, column) for row, column in seats if seat_map.is_taken(row, column)]
+    if taken:
+        raise SeatTaken(taken)
+    _check_holds(session.pk, seats, wallet.viewer_id)
+
+    price = session.price
+    total = price * len(seats)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                # bulk_create не шле post_save — карту оновлюємо самі нижче
+                claimed = Seat.objects.bulk_create([
+                    Seat(session=session, row=row, column=column, viewer_id=wallet.viewer_id)
+                    for row, column in seats
+                ])
+        except IntegrityError:
+            raise SeatTaken()
+        if len(seats) == 1:
+            row, column = seats[0]
+            description = f"Покупка квитка на '{session.movie.title}' (ряд {row}, місце {column})"
+        else:
+            description = f"Покупка {len(seats)} квитків на '{session.movie.title}'"
+        debit(
+            wallet, total, description,
+            items=[{"row": row, "column": column, "price": str(price)} for row, column in seats],
+        )
+
+        def take(seat_map):
+            for row, column in seats:
+                seat_map.take(row, column)
+        _update_seat_map(session.pk, take)
+        transaction.on_commit(lambda: _release_sold(session.pk, wallet.viewer_id, seats))
+    return claimed
+
+
+def _release_sold(session_id, viewer_id, seats):
+    try:
+        release_holds(session_id, viewer_id, seats)
+    except HoldsBusy:
+        # покупка вже пройшла; ключі утримань самі спливуть за SEAT_HOLD_TTL
+        pass
+
+
+def release_seat(seat):
+    """Повертає продане місце у продаж (повернення квитка)."""
+    with transaction.atomic():
+        seat._seat_map_synced = True
+        seat.delete()
+
+        def release(seat_map):
+            if seat_map.contains(seat.row, seat.column):
+                seat_map.release(seat.row, seat.column)
+        _update_seat_map(seat.session_id, release)
+
+
+def rebuild_seat_map(session_id):
+    """
+    Збирає карту сеансу заново з таблиці Seat — після правок в адмінці
+    чи інших змін повз sell_seat / release_seat.
+    """
+    with transaction.atomic():
+        session = Session.objects.select_for_update().select_related('hall').filter(pk=session_id).first()
+        if session is None:
+            # сеанс видалено разом із місцями
+            return None
+        seat_map = SeatMap(session.hall.rows, session.hall.seats_per_row)
+        for row, column in Seat.objects.filter(session_id=session_id).values_list('row', 'column'):
+            if seat_map.contains(row, column):
+                seat_map.take(row, column)
+        Session.objects.filter(pk=session_id).update(**_seat_map_fields(seat_map))
+    return seat_map
@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, PositiveBigIntegerField, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import DataChange, DataVersion, Movie, MovieNeighbour, Rating, Seat
+
+
+# ============================================================
+# === Версии данных для кэшей рекомендаций ===================
+# ============================================================
+# Каждое изменение увеличивает версию потока ("catalog" — фильмы,
+# "ratings" — оценки) в таблице DataVersion, а в DataChange под этой
+# версией записывается, какой объект изменился. Воркеры сравнивают
+# свою версию с общей и догоняют только изменённые строки. Счётчики
+# живут в БД, а не в кэше: кэш процесса у каждого воркера свой, и
+# правку, сделанную через один воркер, остальные бы не увидели.
+CHANGE_TTL = timedelta(days=1)
+# журнал старше CHANGE_TTL чистится раз в столько изменений потока
+CHANGE_PRUNE_EVERY = 1000
+
+
+def version_expression(stream):
+    """Версия потока подзапросом — чтобы прочитать её вместе с другой строкой."""
+    return Coalesce(
+        Subquery(DataVersion.objects.filter(stream=stream).values('version')[:1]),
+        0, output_field=PositiveBigIntegerField(),
+    )
+
+
+def stream_version(stream):
+    version = DataVersion.objects.filter(stream=stream).values_list('version', flat=True).first()
+    return version or 0
+
+
+def record_change(stream, object_id=None):
+    """object_id=None означает, что изменился весь поток."""
+    with transaction.atomic():
+        # UPDATE ... SET version = version + 1 блокирует строку потока,
+        # поэтому параллельные изменения получают разные версии
+        if not DataVersion.objects.filter(stream=stream).update(version=F('version') + 1):
+            DataVersion.objects.get_or_create(stream=stream)
+            DataVersion.objects.filter(stream=stream).update(version=F('version') + 1)
+        version = DataVersion.objects.values_list('version', flat=True).get(stream=stream)
+        DataChange.objects.create(stream=stream, version=version, object_id=object_id)
+        if version % CHANGE_PRUNE_EVERY == 0:
+            DataChange.objects.filter(stream=stream, created_at__lt=timezone.now() - CHANGE_TTL).delete()
+    return version
+
+
+def stream_changes(stream, since, until):
+    """
+    Список id, изменённых между версиями (since, until].
+    None — если журнал неполный и нужна полная перестройка.
+    """
+    found = dict(
+        DataChange.objects
+        .filter(stream=stream, version__gt=since, version__lte=until)
+        .values_list('version', 'object_id')
+    )
+    if len(found) != until - since:
+        return None
+    return [found[version] for version in range(since + 1, until + 1)]
+
+
+def catalog_version():
+    return stream_version("catalog")
+
+
+def catalog_changes(since, until):
+    return stream_changes("catalog", since, until)
+
+
+def record_catalog_change(movie_id=None):
+    return record_change("catalog", movie_id)
+
+
+def ratings_version():
+    return stream_version("ratings")
+
+
+def ratings_changes(since, until):
+    """id зрителей, чьи оценки изменились."""
+    return stream_changes("ratings", since, until)
+
+
+def _on_commit_change(movie_id=None, affected=()):
+    def apply():
+        # фасад импортирует этот модуль — берём его при вызове
+        from .recommender import refresh_neighbours_in_background
+
+        record_catalog_change(movie_id)
+        refresh_neighbours_in_background(None if movie_id is None else [movie_id], affected=affected)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, **kwargs):
+    _on_commit_change(instance.pk)
+
+
+@receiver(pre_delete, sender=Movie)
+def movie_deleting(sender, instance, **kwargs):
+    # каскад удалит фильм из чужих списков соседей — запоминаем, из каких
+    instance._neighbour_of = list(
+        MovieNeighbour.objects.filter(neighbour=instance).values_list('movie_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Movie)
+def movie_deleted(sender, instance, **kwargs):
+    _on_commit_change(instance.pk, getattr(instance, '_neighbour_of', ()))
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def movie_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _on_commit_change(instance.pk)
+    elif pk_set:
+        # genre.movies.add(...) — меняются жанры у каждого из фильмов
+        for movie_id in pk_set:
+            _on_commit_change(movie_id)
+    else:
+        # genre.movies.clear() не сообщает, какие фильмы затронуты
+        _on_commit_change(None)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_changed(sender, instance, **kwargs):
+    viewer_id = instance.viewer_id
+    transaction.on_commit(lambda: record_change("ratings", viewer_id))
+
+
+# ============================================================
+# === Карта мест сеанса ======================================
+# ============================================================
+# sell_seat / release_seat сами обновляют Session.seat_map; всё
+# остальное (админка, ручные правки) пересобирает карту по Seat.
+@receiver(post_save, sender=Seat)
+@receiver(post_delete, sender=Seat)
+def seat_changed(sender, instance, **kwargs):
+    if getattr(instance, '_seat_map_synced', False):
+        return
+    from .seating import rebuild_seat_map
+
+    session_id = instance.session_id
+    transaction.on_commit(lambda: rebuild_seat_map(session_id))
@@ -1,6 +1,30 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Movie, Genre
+import numpy as np
+
+from .models import (
+    CustomUser, Movie, Genre, Hall, MovieActivity, PromoCode, Rating, Seat, Session, Viewer,
+    Transaction, ViewerRecommendation, Wallet,
+)
+from .seating import (
+    GROUP_MAX_SEATS, SEAT_HOLD_TTL, InsufficientFunds, SeatHeld, SeatMap, SeatTaken, active_holds, best_block,
+    buy_ticket, buy_tickets, hold_seats, rebuild_seat_map, release_seat, sell_seat,
+)
+from .ledger import PromoRejected, credit, debit, redeem_promo
+from .scheduling import ScheduleError, schedule_sessions
 
 class MovieListViewTests(TestCase):
     def test_movie_list_view(self):
@@ -8,4 +32,1223 @@ class MovieListViewTests(TestCase):
         Movie.objects.create(title="Test Movie", genre=genre, release_year=2025)
         response = self.client.get(reverse('movie_list'))
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, "Test Movie")
\ No newline at end of file
+        self.assertContains(response, "Test Movie")
+
+@override_settings(RECOMMENDATION_WORKERS=0)
+class HybridRecommendationsTests(TestCase):
+    def setUp(self):
+        from .recommendations import _cf_cache, _tfidf_cache
+        _tfidf_cache["index"] = None
+        _cf_cache["gram"] = None
+
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+        settings_override = self.settings(RECOMMENDATION_INDEX_DIR=self.index_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        action = Genre.objects.create(name="Action")
+        drama = Genre.objects.create(name="Drama")
+        self.viewer = Viewer.objects.create(first_name="Test")
+
+        self.seed = Movie.objects.create(
+            title="Seed", release_year=2020,
+            full_description="space robots fight aliens on mars"
+        )
+        self.seed.genres.add(action)
+        self.close = Movie.objects.create(
+            title="Close", release_year=2021,
+            full_description="robots fight aliens in deep space"
+        )
+        self.close.genres.add(action)
+        self.far = Movie.objects.create(
+            title="Far", release_year=2019,
+            full_description="quiet family drama about a village wedding"
+        )
+        self.far.genres.add(drama)
+
+    def test_matches_pairwise_similarity(self):
+        from .recommendations import (
+            _tfidf_cache, hybrid_recommendations,
+            genre_similarity, description_similarity,
+        )
+        Rating.objects.create(viewer=self.viewer, movie=self.seed, score=9)
+
+        recs = hybrid_recommendations(self.viewer, limit=5)
+        self.assertEqual(recs, [self.close, self.far])
+
+        index = _tfidf_cache["index"]
+        for candidate in (self.close, self.far):
+            expected = (
+                0.45 * genre_similarity(self.seed, candidate)
+                + 0.55 * description_similarity(self.seed, candidate)
+            )
+            actual = _tfidf_cache["similarity"][index[candidate.id], index[self.seed.id]]
+            self.assertAlmostEqual(float(actual), expected, places=5)
+
+    def test_query_count_does_not_grow_with_ratings(self):
+        from .recommendations import hybrid_recommendations
+        Rating.objects.create(viewer=self.viewer, movie=self.seed, score=9)
+        hybrid_recommendations(self.viewer, limit=5)
+
+        # 4 запити до моделей і 2 читання версій каталогу й оцінок
+        with self.assertNumQueries(6):
+            hybrid_recommendations(self.viewer, limit=5)
+
+        Rating.objects.create(viewer=self.viewer, movie=self.far, score=2)
+        with self.assertNumQueries(6):
+            hybrid_recommendations(self.viewer, limit=5)
+
+    def test_approximate_mode_ranks_like_exact(self):
+        from .recommendations import _tfidf_cache, hybrid_recommendations
+        Rating.objects.create(viewer=self.viewer, movie=self.seed, score=9)
+
+        with self.settings(RECOMMENDATION_SIMILARITY_MODE='approximate'):
+            recs = hybrid_recommendations(self.viewer, limit=5)
+            self.assertIsNone(_tfidf_cache["similarity"])
+            self.assertIsNotNone(_tfidf_cache["ann"])
+        self.assertEqual(recs, [self.close, self.far])
+
+    def test_movie_edit_updates_only_its_row(self):
+        from .recommendations import _get_similarity_cache, description_similarity
+        cache = _get_similarity_cache()
+        vectorizer = cache["vectorizer"]
+        self.assertLess(description_similarity(self.seed, self.far), 0.1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.full_description = "space robots fight aliens on mars"
+            self.far.save()
+
+        self.assertGreater(description_similarity(self.seed, self.far), 0.99)
+        self.assertIs(_get_similarity_cache()["vectorizer"], vectorizer)
+
+    def test_incremental_update_leaves_old_snapshot_intact(self):
+        from .recommendations import _get_similarity_cache
+        snapshot = _get_similarity_cache()
+        ids = list(snapshot["movie_ids"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            extra = Movie.objects.create(title="Extra", release_year=2022, full_description="robots on mars")
+
+        fresh = _get_similarity_cache()
+        self.assertIn(extra.id, fresh["index"])
+        self.assertEqual(snapshot["movie_ids"], ids)
+        self.assertNotIn(extra.id, snapshot["index"])
+        self.assertEqual(snapshot["similarity"].shape, (len(ids), len(ids)))
+
+        # правка наявного фільму теж не чіпає вже видані знімки
+        before = _get_similarity_cache()
+        similarity = before["similarity"].copy()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.full_description = "space robots fight aliens on mars"
+            self.far.save()
+        after = _get_similarity_cache()
+        self.assertIsNot(after["similarity"], before["similarity"])
+        np.testing.assert_array_equal(before["similarity"], similarity)
+        self.assertFalse(np.array_equal(after["similarity"], similarity))
+
+    def test_approximate_edit_leaves_old_index_intact(self):
+        from .recommendations import _get_similarity_cache
+        with self.settings(RECOMMENDATION_SIMILARITY_MODE='approximate'):
+            before = _get_similarity_cache()["ann"]
+            codes, buckets = before.codes.copy(), [dict(table) for table in before.buckets]
+            with self.captureOnCommitCallbacks(execute=True):
+                self.far.full_description = "space robots fight aliens on mars"
+                self.far.save()
+            after = _get_similarity_cache()["ann"]
+
+        self.assertIsNot(after, before)
+        np.testing.assert_array_equal(before.codes, codes)
+        for table, original in zip(before.buckets, buckets):
+            self.assertEqual(table.keys(), original.keys())
+            for code, rows in original.items():
+                self.assertIs(table[code], rows)
+        row = _get_similarity_cache()["index"][self.far.id]
+        self.assertIn(row, after.candidates(after.vectors[row]))
+
+    def test_index_round_trips_through_disk(self):
+        from .recommendations import _tfidf_cache, _get_similarity_cache, hybrid_recommendations
+        Rating.objects.create(viewer=self.viewer, movie=self.seed, score=9)
+        call_command('build_similarity_index', stdout=open(os.devnull, 'w'))
+        expected = np.array(_tfidf_cache["similarity"])
+
+        _tfidf_cache["index"] = None
+        cache = _get_similarity_cache()
+        self.assertIsInstance(cache["similarity"], np.memmap)
+        np.testing.assert_allclose(cache["similarity"], expected)
+        self.assertEqual(hybrid_recommendations(self.viewer, limit=5), [self.close, self.far])
+
+    def test_index_newer_than_version_counter_is_rebuilt(self):
+        from .models import DataVersion
+        from .recommendations import _tfidf_cache, _get_similarity_cache
+        from .signals import record_catalog_change
+        record_catalog_change()
+        call_command('build_similarity_index', stdout=open(os.devnull, 'w'))
+
+        # БД відновили з копії без лічильників — версія почалася знову
+        DataVersion.objects.filter(stream="catalog").delete()
+        _tfidf_cache["index"] = None
+        cache = _get_similarity_cache()
+        self.assertNotIsInstance(cache["similarity"], np.memmap)
+        self.assertEqual(cache["version"], 0)
+
+    def test_version_counters_and_change_log_live_in_the_database(self):
+        from .models import DataChange
+        from .signals import catalog_changes, catalog_version, record_catalog_change
+        start = catalog_version()
+        # інший воркер зі своїм кешем бачить ту саму версію
+        caches['default'].clear()
+        first = record_catalog_change(self.far.id)
+        second = record_catalog_change()
+        self.assertEqual((first, second), (start + 1, start + 2))
+        self.assertEqual(catalog_version(), second)
+        self.assertEqual(catalog_changes(start, second), [self.far.id, None])
+
+        DataChange.objects.filter(stream="catalog", version=first).delete()
+        self.assertIsNone(catalog_changes(start, second))
+
+    def test_collaborative_signal_and_incremental_refresh(self):
+        from .recommendations import _cf_cache, _ensure_cf_cache, collaborative_preference
+        other = Viewer.objects.create(first_name="Other")
+        Rating.objects.create(viewer=other, movie=self.seed, score=10)
+        Rating.objects.create(viewer=other, movie=self.far, score=10)
+        Rating.objects.create(viewer=self.viewer, movie=self.seed, score=9)
+
+        movie_ids = [self.seed.id, self.close.id, self.far.id]
+        prefs = collaborative_preference({self.seed.id: 9}, movie_ids)
+        self.assertGreater(prefs[2], 0)
+        self.assertEqual(prefs[1], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(viewer=other, movie=self.close, score=1)
+        incremental = collaborative_preference({self.seed.id: 9}, movie_ids)
+        self.assertLess(incremental[1], 0)
+
+        _ensure_cf_cache()
+        np.testing.assert_allclose(
+            incremental, collaborative_preference({self.seed.id: 9}, movie_ids), rtol=1e-5
+        )
+
+    def test_activity_vectors_match_single_movie_score(self):
+        from .recommendations import (
+            _get_similarity_cache, activity_scores, activity_vectors, recent_activity_score,
+        )
+        MovieActivity.objects.create(viewer=self.viewer, movie=self.close, time_spent=120, watched_trailer=True)
+        MovieActivity.objects.create(viewer=self.viewer, movie=self.far, time_spent=900, watched_movie=True)
+        index = _get_similarity_cache()["index"]
+
+        with self.assertNumQueries(1):
+            scores = activity_scores(*activity_vectors(self.viewer, index))
+
+        for movie in (self.seed, self.close, self.far):
+            self.assertAlmostEqual(
+                float(scores[index[movie.id]]), recent_activity_score(self.viewer, movie), places=5
+            )
+
+    def test_genre_masks_span_several_words(self):
+        from .recommendations import _genre_jaccard, _genre_masks, _get_similarity_cache
+        rng = np.random.default_rng(0)
+        sets = [set(rng.choice(150, size=rng.integers(0, 10), replace=False)) for _ in range(40)]
+        rows = [row for row, genres in enumerate(sets) for _ in genres]
+        bits = [bit for genres in sets for bit in genres]
+        masks = _genre_masks(rows, bits, len(sets), 150)
+        self.assertEqual(masks.shape, (40, 3))
+
+        jaccard = _genre_jaccard(masks, masks)
+        for i, a in enumerate(sets):
+            for j, b in enumerate(sets):
+                expected = len(a & b) / len(a | b) if a | b else 0.0
+                self.assertAlmostEqual(float(jaccard[i, j]), expected, places=6)
+
+        # 64-й жанр не вміщується в одне слово — маски розширюються на льоту
+        vectorizer = _get_similarity_cache()["vectorizer"]
+        extra = [Genre.objects.create(name=f"Genre {i}") for i in range(64)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seed.genres.add(*extra)
+            self.close.genres.add(extra[-1])
+        cache = _get_similarity_cache()
+        self.assertIs(cache["vectorizer"], vectorizer)
+        self.assertEqual(cache["genres"].shape[1], 2)
+        row = cache["index"]
+        self.assertAlmostEqual(
+            float(_genre_jaccard(cache["genres"][[row[self.seed.id]]], cache["genres"][[row[self.close.id]]])[0, 0]),
+            2 / 65, places=6,
+        )
+
+
+class CachedRecommendationsTests(TestCase):
+    def setUp(self):
+        caches['recommendations'].clear()
+        user = CustomUser.objects.create_user(email="viewer@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        self.client.force_login(user)
+        genre = Genre.objects.create(name="Action")
+        for title in ("One", "Two", "Three"):
+            Movie.objects.create(title=title, release_year=2020).genres.add(genre)
+
+    def test_repeat_visit_hits_cache_until_viewer_rates(self):
+        from .recommender import cached_recommendations
+        first = cached_recommendations(self.viewer, limit=5)
+
+        with self.assertNumQueries(1):  # лише версія каталогу
+            self.assertEqual(cached_recommendations(self.viewer, limit=5), first)
+
+        movie = Movie.objects.get(title="Two")
+        self.client.post(reverse('rate_movie', args=[movie.id]), {'score': 9})
+
+        recs = cached_recommendations(self.viewer, limit=5)
+        self.assertNotIn(movie, recs)
+
+    def test_refresh_finishing_after_invalidation_does_not_restore_old_list(self):
+        from . import recommender
+        old = recommender.cached_recommendations(self.viewer, limit=5)
+        recommender.invalidate_recommendations(self.viewer)
+
+        # фоновий розрахунок почався до скидання, а дописує після нього
+        compute = recommender.hybrid_recommendations
+        def late_compute(viewer, limit):
+            movies = compute(viewer, limit=limit)
+            recommender.invalidate_recommendations(viewer)
+            return movies
+        with mock.patch.object(recommender, 'hybrid_recommendations', side_effect=late_compute):
+            self.assertEqual(recommender.cached_recommendations(self.viewer, limit=5), old)
+        self.assertIsNone(caches['recommendations'].get(recommender.VIEWER_RECOMMENDATIONS_KEY.format(self.viewer.id)))
+
+        # запис, що таки потрапив у кеш зі старим штампом, не віддається
+        stale = {"version": recommender._stamps(self.viewer.id)[0], "stamp": 0, "results": {5: []}}
+        caches['recommendations'].set(recommender.VIEWER_RECOMMENDATIONS_KEY.format(self.viewer.id), stale)
+        self.assertEqual(recommender.cached_recommendations(self.viewer, limit=5), old)
+        movies, pending = recommender.recommendations_snapshot(self.viewer, limit=5)
+        self.assertEqual((movies, pending), (old, False))
+
+    def test_precomputed_table_serves_cache_miss(self):
+        from .recommender import cached_recommendations
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        with self.settings(RECOMMENDATION_INDEX_DIR=index_dir):
+            call_command('precompute_recommendations', workers=1, top_k=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(ViewerRecommendation.objects.filter(viewer=self.viewer).count(), 2)
+
+        with self.assertNumQueries(3):  # версії, таблиця і перевірка штампа перед записом
+            recs = cached_recommendations(self.viewer, limit=2)
+        self.assertEqual(len(recs), 2)
+
+        # ночних рядків менше за limit — список добирається живим розрахунком
+        caches['recommendations'].clear()
+        recs = cached_recommendations(self.viewer, limit=3)
+        self.assertEqual(len(recs), 3)
+        self.assertEqual(len(set(recs)), 3)
+
+    def test_interaction_marks_precomputed_rows_stale(self):
+        from .recommender import cached_recommendations, recommendations_snapshot
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        with self.settings(RECOMMENDATION_INDEX_DIR=index_dir):
+            call_command('precompute_recommendations', workers=1, top_k=2, stdout=open(os.devnull, 'w'))
+        rated = ViewerRecommendation.objects.get(viewer=self.viewer, rank=1).movie
+
+        self.client.post(reverse('rate_movie', args=[rated.id]), {'score': 9})
+        self.assertEqual(ViewerRecommendation.objects.filter(viewer=self.viewer, is_stale=True).count(), 2)
+        self.assertNotIn(rated, cached_recommendations(self.viewer, limit=2))
+
+        caches['recommendations'].clear()
+        with mock.patch('schedule.recommender.refresh_in_background', return_value=True):
+            movies, pending = recommendations_snapshot(self.viewer, limit=2)
+        self.assertEqual(len(movies), 2)
+        self.assertTrue(pending)
+
+    def test_api_serves_stale_list_while_refreshing_in_background(self):
+        from . import recommender
+        from .signals import record_catalog_change
+        first = recommender.cached_recommendations(self.viewer, limit=5)
+
+        data = self.client.get(reverse('recommendations_api')).json()
+        self.assertFalse(data["pending"])
+        self.assertEqual([m["id"] for m in data["movies"]], [m.id for m in first])
+
+        record_catalog_change()
+        with mock.patch.object(recommender, 'refresh_in_background', return_value=True) as refresh:
+            data = self.client.get(reverse('recommendations_api')).json()
+        self.assertTrue(data["pending"])
+        self.assertEqual(len(data["movies"]), len(first))
+        refresh.assert_called_once_with(self.viewer.id, 5)
+
+
+class BackgroundRefreshTests(TransactionTestCase):
+    """Фоновий пул recommender.py: справжній _refresh у власному потоці."""
+
+    def setUp(self):
+        from .recommendations import _cf_cache, _tfidf_cache
+        _tfidf_cache["index"] = None
+        _cf_cache["gram"] = None
+        caches['recommendations'].clear()
+        self.viewer = Viewer.objects.create(first_name="Test")
+        # bulk_create без сигналів — у пулі лише задачі самого тесту
+        Movie.objects.bulk_create(Movie(title=title, release_year=2020) for title in ("One", "Two", "Three"))
+
+    def test_background_queue_deduplicates_and_is_bounded(self):
+        from . import recommender
+        real = recommender.cached_recommendations
+        release, calls = threading.Event(), []
+
+        def slow_recommendations(viewer, limit):
+            calls.append(viewer.id)
+            release.wait(5)
+            return real(viewer, limit)
+
+        with self.settings(RECOMMENDATION_QUEUE_SIZE=1), \
+                mock.patch.object(recommender, 'cached_recommendations', slow_recommendations):
+            self.assertTrue(recommender.refresh_in_background(self.viewer.id, 5))
+            self.assertTrue(recommender.refresh_in_background(self.viewer.id, 5))
+            self.assertFalse(recommender.refresh_in_background(self.viewer.id + 1, 5))
+            release.set()
+            for _ in range(50):
+                if not recommender._pending:
+                    break
+                time.sleep(0.1)
+
+        self.assertEqual(calls, [self.viewer.id])
+        self.assertFalse(recommender._pending)
+        # _refresh поклав список у кеш — наступний запит без перерахунку
+        entry = recommender._recommendations_cache().get(recommender.VIEWER_RECOMMENDATIONS_KEY.format(self.viewer.id))
+        self.assertIn(5, entry["results"])
+
+
+class RecommendationTimingTests(TestCase):
+    def setUp(self):
+        from .profiling import recommendation_stats
+        from .recommendations import _cf_cache, _tfidf_cache
+        _tfidf_cache["index"] = None
+        _cf_cache["gram"] = None
+        caches['recommendations'].clear()
+        recommendation_stats.clear()
+        user = CustomUser.objects.create_user(email="viewer@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        self.client.force_login(user)
+        genre = Genre.objects.create(name="Action")
+        for title in ("One", "Two", "Three"):
+            Movie.objects.create(title=title, release_year=2020).genres.add(genre)
+        Rating.objects.create(viewer=self.viewer, movie=Movie.objects.get(title="One"), score=9)
+
+    def test_stages_reach_hooks(self):
+        from .profiling import recommendation_stats
+        from .recommendations import hybrid_recommendations
+        received = []
+        with mock.patch('schedule.profiling.timing_hooks', return_value=[received.append]):
+            hybrid_recommendations(self.viewer, limit=2)
+
+        timings = received[0]
+        for stage in ("catalog", "ratings", "activity", "similarity", "ranking"):
+            self.assertIn(stage, timings)
+        self.assertEqual(timings["catalog"]["queries"], 1)
+        self.assertEqual(timings["ratings"]["queries"], 1)
+        self.assertEqual(
+            timings["total"]["queries"],
+            sum(stage["queries"] for name, stage in timings.items() if name != "total"),
+        )
+
+        hybrid_recommendations(self.viewer, limit=2)
+        self.assertEqual(recommendation_stats.summary()["total"]["count"], 1)
+
+    def test_debug_response_carries_server_timing(self):
+        url = reverse('recommendations_api') + '?sync=1'
+        with self.settings(DEBUG=True):
+            response = self.client.get(url)
+        self.assertIn('rec-similarity;dur=', response['Server-Timing'])
+
+        caches['recommendations'].clear()
+        with mock.patch('schedule.recommender.refresh_in_background', return_value=True):
+            response = self.client.get(url)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        from .recommendations import _cf_cache, _tfidf_cache
+        _tfidf_cache["index"] = None
+        _cf_cache["gram"] = None
+        caches['default'].clear()
+        caches['recommendations'].clear()
+        user = CustomUser.objects.create_user(email="viewer@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        self.client.force_login(user)
+        self.movies = [Movie.objects.create(title=title, release_year=2020) for title in ("One", "Two", "Three")]
+
+    def test_events_update_counters_and_new_viewers_get_trending(self):
+        from .recommendations import hybrid_recommendations
+        from .trending import trending_movies
+        popular = self.movies[2]
+        self.client.post(reverse('rate_movie', args=[popular.id]), {'score': 10})
+        self.client.post(reverse('track_activity', args=[self.movies[1].id]), {'time_spent': 30})
+
+        self.assertEqual([movie_id for movie_id, _ in trending_movies()], [popular.id, self.movies[1].id])
+        with self.assertNumQueries(1):  # готовий список зі спільного кешу
+            trending_movies()
+
+        newcomer = Viewer.objects.create(first_name="New")
+        self.assertEqual(hybrid_recommendations(newcomer, limit=1), [popular])
+
+    def test_rerating_does_not_inflate_trend(self):
+        from .models import MovieTrend
+        movie = self.movies[0]
+        self.client.post(reverse('rate_movie', args=[movie.id]), {'score': 8})
+        score = MovieTrend.objects.get(movie=movie).score
+        for _ in range(3):
+            self.client.post(reverse('rate_movie', args=[movie.id]), {'score': 9})
+        self.assertEqual(MovieTrend.objects.get(movie=movie).score, score)
+        self.assertEqual(Rating.objects.get(movie=movie).score, 9)
+
+    def test_counters_decay_and_rebuild_matches_increments(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import MovieTrend
+        from .trending import TRENDING_HALF_LIFE, rebuild_trending, record_event, refresh_trending
+
+        now = timezone.now()
+        record_event(self.movies[0].id, 'rating', weight=1.0, when=now - TRENDING_HALF_LIFE)
+        record_event(self.movies[1].id, 'rating', weight=0.6, when=now)
+        trending = dict(refresh_trending())
+        self.assertAlmostEqual(trending[self.movies[0].id], 1.0, places=3)
+        self.assertAlmostEqual(trending[self.movies[1].id], 1.2, places=3)
+
+        Rating.objects.create(viewer=self.viewer, movie=self.movies[0], score=10)
+        Rating.objects.filter(movie=self.movies[0]).update(created_at=now - timedelta(days=28))
+        MovieActivity.objects.create(viewer=self.viewer, movie=self.movies[2], time_spent=300)
+        trending = rebuild_trending()
+        self.assertEqual([movie_id for movie_id, _ in trending], [self.movies[2].id, self.movies[0].id])
+        self.assertEqual(MovieTrend.objects.count(), 2)
+
+
+class SeatMapTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="viewer@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        Wallet.objects.create(viewer=self.viewer, balance=1000)
+        self.client.force_login(user)
+        movie = Movie.objects.create(title="Premiere", release_year=2025)
+        self.hall = Hall.objects.create(name="Big", rows=40, seats_per_row=60)
+        self.session = Session.objects.create(movie=movie, hall=self.hall, datetime="2025-01-01T20:00Z")
+
+    def test_new_session_creates_no_seat_rows(self):
+        self.assertEqual(Seat.objects.count(), 0)
+        seat_map = SeatMap.for_session(self.session)
+        self.assertEqual((seat_map.total, seat_map.sold), (2400, 0))
+
+    def test_ticket_purchase_marks_bitmap_and_stores_only_sold_seat(self):
+        url = reverse('confirm_ticket', args=[self.session.id, 3, 7])
+        self.client.post(url)
+        self.session.refresh_from_db()
+        seat_map = SeatMap.for_session(self.session)
+        self.assertTrue(seat_map.is_taken(3, 7))
+        self.assertFalse(seat_map.is_taken(7, 3))
+        self.assertEqual(seat_map.sold, 1)
+        self.assertEqual(list(Seat.objects.values_list('row', 'column', 'viewer')), [(3, 7, self.viewer.id)])
+
+        with self.assertRaises(SeatTaken):
+            sell_seat(self.session, 3, 7, self.viewer)
+
+        response = self.client.get(reverse('seat_selection', args=[self.session.id]))
+        self.assertEqual(response.context['seat_rows'][2][6]['viewer_id'], self.viewer.id)
+        self.assertEqual(sum(seat['is_reserved'] for row in response.context['seat_rows'] for seat in row), 1)
+
+    def test_taken_seat_without_owner_shows_message(self):
+        url = reverse('seat_selection', args=[self.session.id])
+        seat_map = SeatMap.for_session(self.session)
+        seat_map.take(4, 4)
+        Session.objects.filter(pk=self.session.pk).update(seat_map=seat_map.to_bytes())
+        seat = Seat.objects.create(session=self.session, row=5, column=5, viewer=None)
+        seat_map.take(5, 5)
+        Session.objects.filter(pk=self.session.pk).update(seat_map=seat_map.to_bytes())
+
+        # біт є, а рядка немає (повернення в процесі) — і квиток без глядача
+        for row, column in ((4, 4), (seat.row, seat.column)):
+            response = self.client.post(url, {'row': row, 'column': column})
+            self.assertRedirects(response, url)
+
+    def test_seat_map_api_is_cached_and_revalidated_by_etag(self):
+        caches['default'].clear()
+        url = reverse('session_seats', args=[self.session.id])
+        response = self.client.get(url)
+        data = response.json()
+        self.assertEqual((len(data["seats"]), data["sold"]), (2400, 0))
+        etag = response['ETag']
+
+        with self.assertNumQueries(2):  # версія карти і утримання зі спільного кешу
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.assertNumQueries(3):  # ще готова карта з кешу, без Session
+            self.assertEqual(self.client.get(url).json()["seats"], data["seats"])
+
+        # інший воркер зі своїм (порожнім) кешем дає той самий ETag
+        caches['default'].clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        sell_seat(self.session, 2, 1, self.viewer)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()["seats"][60], "1")
+        self.assertEqual(response.json()["sold"], 1)
+
+    def test_direct_seat_changes_rebuild_bitmap(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seat = Seat.objects.create(session=self.session, row=40, column=60, viewer=self.viewer)
+        self.session.refresh_from_db()
+        self.assertTrue(SeatMap.for_session(self.session).is_taken(40, 60))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            seat.delete()
+        self.session.refresh_from_db()
+        self.assertEqual(SeatMap.for_session(self.session).sold, 0)
+
+
+class SeatHoldTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        users = [
+            CustomUser.objects.create_user(email=f"hold{i}@example.com", password="pass") for i in range(2)
+        ]
+        self.viewers = [Viewer.objects.create(user=user, first_name="Test") for user in users]
+        for viewer in self.viewers:
+            Wallet.objects.create(viewer=viewer, balance=1000)
+        self.users = users
+        movie = Movie.objects.create(title="Premiere", release_year=2025)
+        hall = Hall.objects.create(name="Big", rows=40, seats_per_row=60)
+        self.session = Session.objects.create(movie=movie, hall=hall, datetime="2025-01-01T20:00Z", price=100)
+        self.seats_url = reverse('session_seats', args=[self.session.id])
+
+    def test_checkout_holds_seat_for_buyer_only(self):
+        from .seating import SEAT_HOLD_KEY
+        self.client.force_login(self.users[0])
+        hold_seats(self.session.id, [(3, 7)], self.viewers[0].id)
+        # окреме підключення до кешу, як в іншому воркері gunicorn, бачить утримання
+        other_worker = caches.create_connection('default')
+        self.assertEqual(other_worker.get(SEAT_HOLD_KEY.format(self.session.id, 3, 7)), self.viewers[0].id)
+        self.assertEqual(self.client.get(self.seats_url).json()["seats"][2 * 60 + 6], "2")
+
+        self.client.force_login(self.users[1])
+        response = self.client.get(reverse('confirm_ticket', args=[self.session.id, 3, 7]))
+        self.assertRedirects(response, reverse('seat_selection', args=[self.session.id]))
+        session = Session.objects.select_related('movie', 'hall').get(pk=self.session.pk)
+        with self.assertRaises(SeatHeld):
+            buy_ticket(session, 3, 7, self.viewers[1].wallet)
+        response = self.client.post(reverse('hold_session_seats', args=[self.session.id]), {'seats': ['3-6', '3-7']})
+        self.assertEqual(response.json()['held'], ['3-7'])
+        # все або нічого: 3-6 теж не утримано
+        self.assertEqual(active_holds(self.session.id), {(3, 7): self.viewers[0].id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            buy_ticket(session, 3, 7, self.viewers[0].wallet)
+        self.assertEqual(active_holds(self.session.id), {})
+        self.assertEqual(self.client.get(self.seats_url).json()["seats"][2 * 60 + 6], "1")
+
+    def test_abandoned_checkout_releases_all_holds(self):
+        self.client.force_login(self.users[0])
+        self.client.get(reverse('confirm_ticket', args=[self.session.id, 1, 1]))
+        self.client.post(reverse('hold_session_seats', args=[self.session.id]), {'seats': ['1-2', '1-3']})
+        hold_seats(self.session.id, [(9, 9)], self.viewers[1].id)
+        self.assertEqual(self.client.get(self.seats_url).json()["held"], 4)
+
+        response = self.client.post(reverse('release_session_seats', args=[self.session.id]))
+        self.assertEqual(response.json()['released'], 3)
+        self.assertEqual(active_holds(self.session.id), {(9, 9): self.viewers[1].id})
+        self.assertEqual(self.client.get(self.seats_url).json()["seats"][:3], "000")
+
+    def test_viewer_holds_are_capped_and_auto_pick_replaces_them(self):
+        viewer_id = self.viewers[0].id
+        hold_seats(self.session.id, [(1, column) for column in range(1, GROUP_MAX_SEATS + 1)], viewer_id)
+        with self.assertRaises(ValueError):
+            hold_seats(self.session.id, [(2, 1)], viewer_id)
+        self.client.force_login(self.users[0])
+        response = self.client.post(reverse('hold_session_seats', args=[self.session.id]), {'seats': ['2-1']})
+        self.assertEqual(response.status_code, 400)
+
+        # новий блок автовибору звільняє попередній вибір
+        picked = self.client.post(reverse('auto_pick_seats', args=[self.session.id]), {'count': 2}).json()['seats']
+        self.assertEqual(
+            {f"{row}-{column}" for row, column in active_holds(self.session.id)}, set(picked)
+        )
+
+    def test_busy_registry_fails_instead_of_writing_unlocked(self):
+        from django.core.cache import cache
+        from .seating import SEAT_HOLD_KEY, SEAT_HOLDS_LOCK_KEY, HoldsBusy
+        cache.add(SEAT_HOLDS_LOCK_KEY.format(self.session.id), 1, timeout=5)
+        with mock.patch('time.sleep'), self.assertRaises(HoldsBusy):
+            hold_seats(self.session.id, [(5, 5)], self.viewers[0].id)
+        self.assertEqual(active_holds(self.session.id), {})
+        self.assertIsNone(cache.get(SEAT_HOLD_KEY.format(self.session.id, 5, 5)))
+
+    def test_holds_expire_on_their_own(self):
+        hold_seats(self.session.id, [(5, 5)], self.viewers[0].id)
+        later = time.time() + SEAT_HOLD_TTL + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(active_holds(self.session.id), {})
+            self.assertEqual(self.client.get(self.seats_url).json()["held"], 0)
+            hold_seats(self.session.id, [(5, 5)], self.viewers[1].id)
+            self.assertEqual(active_holds(self.session.id), {(5, 5): self.viewers[1].id})
+
+
+class SeatCountersTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="counter@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        self.wallet = Wallet.objects.create(viewer=self.viewer, balance=5000)
+        self.movie = Movie.objects.create(title="Premiere", release_year=2025)
+        self.hall = Hall.objects.create(name="Small", rows=2, seats_per_row=10)
+        self.session = Session.objects.create(movie=self.movie, hall=self.hall, datetime="2025-01-01T20:00Z")
+
+    def _counters(self):
+        return Session.objects.values_list('seats_sold', 'seats_total').get(pk=self.session.pk)
+
+    def test_every_sales_path_keeps_counters(self):
+        self.assertEqual(self._counters(), (0, 20))
+        session = Session.objects.select_related('movie', 'hall').get(pk=self.session.pk)
+        buy_tickets(session, [(1, 1), (1, 2), (1, 3)], self.wallet)
+        sell_seat(session, 2, 5, self.viewer)
+        self.assertEqual(self._counters(), (4, 20))
+
+        release_seat(Seat.objects.get(row=1, column=2))
+        self.assertEqual(self._counters(), (3, 20))
+
+        # збереження в адмінці не перезаписує продані місця старим значенням
+        self.session.datetime = "2025-01-02T20:00Z"
+        self.session.save()
+        self.assertEqual(self._counters(), (3, 20))
+
+        Session.objects.filter(pk=self.session.pk).update(seats_sold=0)
+        rebuild_seat_map(self.session.pk)
+        self.assertEqual(self._counters(), (3, 20))
+
+    def test_hall_change_resizes_map_and_is_blocked_after_sales(self):
+        from django.core.exceptions import ValidationError
+        big = Hall.objects.create(name="Big", rows=5, seats_per_row=12)
+        session = Session.objects.get(pk=self.session.pk)
+        session.hall = big
+        session.full_clean()
+        session.save()
+        self.assertEqual(self._counters(), (0, 60))
+        session.refresh_from_db()
+        self.assertEqual(len(bytes(session.seat_map)), (60 + 7) // 8)
+
+        sell_seat(session, 5, 12, self.viewer)
+        session = Session.objects.get(pk=self.session.pk)
+        session.hall = self.hall
+        with self.assertRaises(ValidationError):
+            session.full_clean()
+
+    def test_session_list_shows_availability_without_extra_queries(self):
+        session = Session.objects.select_related('movie', 'hall').get(pk=self.session.pk)
+        buy_tickets(session, [(1, column) for column in range(1, 11)], self.wallet)
+        buy_tickets(session, [(2, column) for column in range(1, 8)], self.wallet)
+        for day in range(2, 6):
+            Session.objects.create(movie=self.movie, hall=self.hall, datetime=f"2025-01-0{day}T20:00Z")
+
+        url = reverse('session_list', args=[self.movie.id])
+        with self.assertNumQueries(2):  # фільм і сеанси
+            response = self.client.get(url)
+        self.assertContains(response, "Вільно 3 з 20")
+        self.assertNotContains(response, "Майже розпродано")
+
+        sell_seat(session, 2, 8, self.viewer)
+        self.assertContains(self.client.get(url), "Майже розпродано", count=1)
+
+
+class AutoPickTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        user = CustomUser.objects.create_user(email="pick@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        Wallet.objects.create(viewer=self.viewer, balance=1000)
+        self.client.force_login(user)
+        movie = Movie.objects.create(title="Premiere", release_year=2025)
+        hall = Hall.objects.create(name="Big", rows=40, seats_per_row=60)
+        self.session = Session.objects.create(movie=movie, hall=hall, datetime="2025-01-01T20:00Z")
+
+    def test_best_block_prefers_center_of_middle_rows(self):
+        seat_map = SeatMap(5, 9)
+        self.assertEqual(best_block(seat_map.availability(), 5, 9, 3), [(3, 4), (3, 5), (3, 6)])
+
+        seat_map.take(3, 5)
+        self.assertEqual(best_block(seat_map.availability(), 5, 9, 3), [(2, 4), (2, 5), (2, 6)])
+        for column in range(1, 10):
+            if column != 5:
+                seat_map.take(3, column)
+        for row in (2, 4):
+            seat_map.take(row, 5)
+        # у сусідніх рядах лишились лише блоки збоку — центр ряду далі кращий
+        self.assertEqual(best_block(seat_map.availability(), 5, 9, 4), [(1, 3), (1, 4), (1, 5), (1, 6)])
+        self.assertEqual(best_block(seat_map.availability(), 5, 9, 1), [(2, 4)])
+        self.assertIsNone(best_block(seat_map.availability(), 5, 9, 10))
+
+    def test_endpoint_picks_and_holds_contiguous_seats(self):
+        url = reverse('auto_pick_seats', args=[self.session.id])
+        first = self.client.post(url, {'count': 4}).json()
+        self.assertEqual(first['seats'], ['20-29', '20-30', '20-31', '20-32'])
+        self.assertEqual(set(active_holds(self.session.id)), {(20, column) for column in range(29, 33)})
+
+        # чуже утримання всередині найкращого блоку — блок обходиться
+        self.client.post(reverse('release_session_seats', args=[self.session.id]))
+        hold_seats(self.session.id, [(20, 30)], self.viewer.id + 1)
+        second = self.client.post(url, {'count': 4}).json()['seats']
+        self.assertNotEqual(second, first['seats'])
+        self.assertNotIn('20-30', second)
+        row, columns = second[0].split('-')[0], [int(seat.split('-')[1]) for seat in second]
+        self.assertTrue(all(seat.startswith(f"{row}-") for seat in second))
+        self.assertEqual(columns, list(range(columns[0], columns[0] + 4)))
+        too_many = self.client.post(url, {'count': 61})
+        self.assertEqual(too_many.status_code, 400)
+
+        response = self.client.post(reverse('book_seats', args=[self.session.id]), {'seats': second})
+        self.assertTrue(response.json()['ok'])
+
+
+class GroupBookingTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="group@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        self.wallet = Wallet.objects.create(viewer=self.viewer, balance=1000)
+        self.client.force_login(user)
+        movie = Movie.objects.create(title="Premiere", release_year=2025)
+        hall = Hall.objects.create(name="Big", rows=40, seats_per_row=60)
+        self.session = Session.objects.create(movie=movie, hall=hall, datetime="2025-01-01T20:00Z", price=100)
+        self.url = reverse('book_seats', args=[self.session.id])
+
+    def test_group_is_paid_once_with_line_items(self):
+        response = self.client.post(self.url, {'seats': ['5-10', '5-11', '5-12']})
+        self.assertEqual(response.json(), {'ok': True, 'seats': ['5-10', '5-11', '5-12'], 'total': '300.00'})
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 700)
+        record = Transaction.objects.get()
+        self.assertEqual(record.amount, 300)
+        self.assertEqual([(item["row"], item["column"]) for item in record.items], [(5, 10), (5, 11), (5, 12)])
+        self.session.refresh_from_db()
+        self.assertEqual(SeatMap.for_session(self.session).sold, 3)
+
+    def test_group_is_all_or_nothing(self):
+        sell_seat(self.session, 5, 11, self.viewer)
+        self.session.refresh_from_db()
+        response = self.client.post(self.url, {'seats': ['5-10', '5-11', '5-12']})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['taken'], ['5-11'])
+
+        # карта ще не знає про продаж — спрацьовує унікальний індекс
+        stale = Session.objects.select_related('movie', 'hall').get(pk=self.session.pk)
+        stale.seat_map = b""
+        with self.assertRaises(SeatTaken):
+            buy_tickets(stale, [(5, 10), (5, 11)], self.wallet)
+
+        response = self.client.post(self.url, {'seats': ['1-%d' % column for column in range(1, 12)]})
+        self.assertEqual(response.status_code, 400)
+        self.wallet.balance = 150
+        self.wallet.save()
+        with self.assertRaises(InsufficientFunds):
+            buy_tickets(stale, [(1, 1), (1, 2)], self.wallet)
+
+        self.assertEqual(Seat.objects.count(), 1)
+        self.assertFalse(Transaction.objects.exists())
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 150)
+
+    def test_query_count_does_not_depend_on_group_size(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=5000)
+        session = Session.objects.select_related('movie', 'hall').get(pk=self.session.pk)
+        with CaptureQueriesContext(connection) as pair:
+            buy_tickets(session, [(1, 1), (1, 2)], self.wallet)
+        session = Session.objects.select_related('movie', 'hall').get(pk=self.session.pk)
+        with CaptureQueriesContext(connection) as group:
+            buy_tickets(session, [(2, column) for column in range(1, 11)], self.wallet)
+        self.assertEqual(len(pair), len(group))
+
+
+@override_settings(RECOMMENDATION_WORKERS=0)
+class ConcurrentTicketSalesTests(TransactionTestCase):
+    """Сотні паралельних покупців одного місця: продано рівно один квиток."""
+
+    BUYERS = 200
+
+    def setUp(self):
+        movie = Movie.objects.create(title="Premiere", release_year=2025)
+        hall = Hall.objects.create(name="Big", rows=40, seats_per_row=60)
+        self.session = Session.objects.create(movie=movie, hall=hall, datetime="2025-01-01T20:00Z", price=100)
+        self.wallets = [
+            Wallet.objects.create(viewer=Viewer.objects.create(first_name=f"Buyer {i}"), balance=150)
+            for i in range(self.BUYERS)
+        ]
+
+    def _race(self, attempts):
+        """attempts: [(wallet, row, column)] — усі стартують одночасно."""
+        start = threading.Barrier(len(attempts))
+        outcomes = []
+
+        def buy(wallet, row, column):
+            try:
+                start.wait()
+                session = Session.objects.select_related('movie', 'hall').get(pk=self.session.pk)
+                buy_ticket(session, row, column, wallet)
+                outcomes.append("sold")
+            except (SeatTaken, InsufficientFunds) as exc:
+                outcomes.append(type(exc).__name__)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=attempt) for attempt in attempts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_no_double_sells(self):
+        outcomes = self._race([(wallet, 5, 30) for wallet in self.wallets])
+
+        self.assertEqual(outcomes.count("sold"), 1)
+        self.assertEqual(Seat.objects.count(), 1)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(sum(w.balance for w in Wallet.objects.all()), 150 * self.BUYERS - 100)
+        self.session.refresh_from_db()
+        self.assertEqual(SeatMap.for_session(self.session).sold, 1)
+
+    def test_parallel_debits_never_overdraw(self):
+        # один гаманець на 1000₴ і 200 одночасних покупок різних місць по 100₴
+        wallet = self.wallets[0]
+        Wallet.objects.filter(pk=wallet.pk).update(balance=1000)
+        outcomes = self._race([(wallet, 1 + i // 60, 1 + i % 60) for i in range(self.BUYERS)])
+
+        self.assertEqual(outcomes.count("sold"), 10)
+        self.assertEqual(outcomes.count("InsufficientFunds"), self.BUYERS - 10)
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, 0)
+        self.assertEqual(Seat.objects.count(), 10)
+        self.assertEqual(Transaction.objects.count(), 10)
+        self.session.refresh_from_db()
+        self.assertEqual(SeatMap.for_session(self.session).sold, 10)
+
+
+class ScheduleImportTests(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(title="Premiere", release_year=2025)
+        self.hall = Hall.objects.create(name="Big", rows=40, seats_per_row=60)
+        self.small = Hall.objects.create(name="Small", rows=5, seats_per_row=10)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_month_of_sessions_in_constant_queries(self):
+        rows = [
+            {"movie": "Premiere", "hall": hall, "datetime": f"2025-03-{day:02d}T{hour:02d}:00:00Z", "price": "150"}
+            for day in range(1, 31) for hour in (10, 13, 16, 19, 22) for hall in ("Big", str(self.small.id))
+        ]
+        # фільми, зали, існуючі сеанси, savepoint і три INSERT по 100
+        with self.assertNumQueries(8):
+            created = schedule_sessions(rows, batch_size=100)
+        self.assertEqual(len(created), 300)
+        self.assertEqual(Session.objects.filter(hall=self.small, price=150).count(), 150)
+        self.assertFalse(Seat.objects.exists())
+
+    def test_command_reads_csv_and_jsonl(self):
+        path = self._write("march.csv", "movie,hall,datetime,price\nPremiere,Big,2025-03-01 10:00,100\n")
+        call_command('import_schedule', path, stdout=open(os.devnull, 'w'))
+        path = self._write("march.jsonl", json.dumps({"movie": self.movie.id, "hall": "Big", "datetime": "2025-03-01T13:00"}) + "\n")
+        call_command('import_schedule', path, stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(Session.objects.order_by('datetime').values_list('price', flat=True)), [100, 120])
+
+    def test_overlaps_and_bad_rows_reject_whole_schedule(self):
+        Session.objects.create(movie=self.movie, hall=self.hall, datetime="2025-03-01T10:00Z")
+        rows = [
+            {"movie": "Premiere", "hall": "Big", "datetime": "2025-03-01T12:00Z"},
+            {"movie": "Premiere", "hall": "Small", "datetime": "2025-03-01T12:00Z"},
+            {"movie": "Premiere", "hall": "Small", "datetime": "2025-03-01T14:30Z"},
+            {"movie": "Unknown", "hall": "Big", "datetime": "tomorrow"},
+            {"movie": "Premiere", "hall": "Small", "datetime": "2025-03-02T12:00Z"},
+        ]
+        with self.assertRaises(ScheduleError) as error:
+            schedule_sessions(rows)
+        self.assertEqual([problem.split(":")[0] for problem in error.exception.errors], ["рядок 4", "рядок 1", "рядок 3"])
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_numeric_titles_free_sessions_and_bad_dates(self):
+        year_movie = Movie.objects.create(title="1917", release_year=2019)
+        rows = [
+            {"movie": "1917", "hall": "Big", "datetime": "2025-03-01T10:00Z", "price": 0},
+            {"movie": str(self.movie.id), "hall": "Big", "datetime": "2025-03-01T14:00Z", "price": ""},
+        ]
+        first, second = schedule_sessions(rows)
+        self.assertEqual((first.movie_id, first.price), (year_movie.id, 0))
+        self.assertEqual((second.movie_id, second.price), (self.movie.id, 120))
+
+        Movie.objects.create(title="Premiere", release_year=1999)
+        rows = [
+            {"movie": "Premiere", "hall": "Big", "datetime": "2025-03-02T10:00Z"},
+            {"movie": str(self.movie.id), "hall": "Big", "datetime": "2025-02-30T10:00Z"},
+        ]
+        with self.assertRaises(ScheduleError) as error:
+            schedule_sessions(rows)
+        first, second = error.exception.errors
+        self.assertIn("кілька фільмів", first)
+        self.assertIn("некоректний час", second)
+
+    def test_prices_that_do_not_fit_the_column_are_rejected(self):
+        prices = ["10000", "1e10", "NaN", "-Infinity", "12.345", "-1", "9999.99", "12.340"]
+        rows = [
+            {"movie": "Premiere", "hall": "Big", "datetime": f"2025-03-{day:02d}T10:00Z", "price": price}
+            for day, price in enumerate(prices, start=1)
+        ]
+        with self.assertRaises(ScheduleError) as error:
+            schedule_sessions(rows)
+        self.assertEqual([problem.split(":")[0] for problem in error.exception.errors], [f"рядок {n}" for n in range(1, 7)])
+        self.assertTrue(all("некоректна ціна" in problem for problem in error.exception.errors))
+
+        created = schedule_sessions(rows[-2:])
+        self.assertEqual([session.price for session in created], [Decimal("9999.99"), Decimal("12.34")])
+
+    def test_command_reports_unreadable_jsonl_lines(self):
+        lines = [json.dumps({"movie": "Premiere", "hall": "Big", "datetime": "2025-03-01T10:00Z"}), "{oops", "", "[1, 2]"]
+        path = self._write("broken.jsonl", "\n".join(lines) + "\n")
+        with self.assertRaises(CommandError) as error:
+            call_command('import_schedule', path, stdout=open(os.devnull, 'w'))
+        self.assertIn("рядок 2: некоректний JSON", str(error.exception))
+        self.assertIn("рядок 3: очікується JSON-об'єкт", str(error.exception))
+        with self.assertRaises(CommandError):
+            call_command('import_schedule', os.path.join(self.tmp, "missing.csv"), stdout=open(os.devnull, 'w'))
+        self.assertFalse(Session.objects.exists())
+
+
+@override_settings(RECOMMENDATION_WORKERS=0)
+class WalletLedgerTests(TransactionTestCase):
+    """Паралельні поповнення і списання одного гаманця нічого не гублять."""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="ledger@example.com", password="pass")
+        self.viewer = Viewer.objects.create(user=user, first_name="Test")
+        self.wallet = Wallet.objects.create(viewer=self.viewer, balance=1000)
+        self.user = user
+
+    def test_parallel_debits_and_credits_stay_consistent(self):
+        operations = [("debit", 30)] * 100 + [("credit", 10)] * 50
+        start = threading.Barrier(len(operations))
+        outcomes = []
+
+        def run(kind, amount):
+            try:
+                start.wait()
+                if kind == "debit":
+                    debit(self.wallet, amount, "test")
+                else:
+                    credit(self.wallet, amount, 'deposit', "test")
+                outcomes.append(kind)
+            except InsufficientFunds:
+                outcomes.append("InsufficientFunds")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=operation) for operation in operations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        debits = outcomes.count("debit")
+        self.assertEqual(outcomes.count("credit"), 50)
+        self.assertEqual(debits + outcomes.count("InsufficientFunds"), 100)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 1000 + 50 * 10 - 30 * debits)
+        self.assertGreaterEqual(self.wallet.balance, 0)
+        self.assertLess(self.wallet.balance, 30 + 50 * 10)
+        self.assertEqual(Transaction.objects.filter(type='spend').count(), debits)
+        self.assertEqual(Transaction.objects.filter(type='deposit').count(), 50)
+
+    def test_views_go_through_ledger(self):
+        self.client.force_login(self.user)
+        movie = Movie.objects.create(title="Premiere", release_year=2025)
+        self.client.post(reverse('wallet_deposit'), {'amount': 100})
+        self.client.post(reverse('confirm_online', args=[movie.id]))
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=10)
+        other = Movie.objects.create(title="Sequel", release_year=2026)
+        response = self.client.post(reverse('confirm_online', args=[other.id]))
+
+        self.assertRedirects(response, reverse('wallet_deposit'), fetch_redirect_response=False)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 10)
+        self.assertEqual(
+            list(Transaction.objects.order_by('created_at', 'id').values_list('type', 'amount')),
+            [('deposit', 100), ('spend', 80)],
+        )
+        self.assertFalse(MovieActivity.objects.filter(movie=other, watched_movie=True).exists())
+
+    def test_parallel_online_purchases_charge_once(self):
+        from django.test import Client
+        movie = Movie.objects.create(title="Premiere", release_year=2025)
+        start = threading.Barrier(10)
+
+        def buy():
+            try:
+                client = Client()
+                client.force_login(self.user)
+                start.wait()
+                client.post(reverse('confirm_online', args=[movie.id]))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 1000 - 80)
+        self.assertEqual(Transaction.objects.filter(type='spend').count(), 1)
+        self.assertTrue(MovieActivity.objects.get(viewer=self.viewer, movie=movie).watched_movie)
+
+
+@override_settings(RECOMMENDATION_WORKERS=0)
+class PromoRedemptionTests(TransactionTestCase):
+    """Промокод із соцмереж: сотні одночасних активацій не перевищують ліміт."""
+
+    VIEWERS = 200
+
+    def setUp(self):
+        self.promo = PromoCode.objects.create(code="HYPE", amount=50, max_uses=40)
+        self.wallets = [
+            Wallet.objects.create(viewer=Viewer.objects.create(first_name=f"Fan {i}"))
+            for i in range(self.VIEWERS)
+        ]
+
+    def _hammer(self, wallets):
+        start = threading.Barrier(len(wallets))
+        outcomes = []
+
+        def redeem(wallet):
+            try:
+                start.wait()
+                redeem_promo(wallet, "hype")
+                outcomes.append("redeemed")
+            except PromoRejected as exc:
+                outcomes.append(str(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=redeem, args=(wallet,)) for wallet in wallets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_limit_holds_under_load(self):
+        outcomes = self._hammer(self.wallets)
+
+        self.assertEqual(outcomes.count("redeemed"), 40)
+        self.assertEqual(outcomes.count("Ліміт активацій промокоду вичерпано."), self.VIEWERS - 40)
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.used_count, 40)
+        self.assertEqual(self.promo.used_by.count(), 40)
+        self.assertEqual(sum(w.balance for w in Wallet.objects.all()), 40 * 50)
+        self.assertEqual(Transaction.objects.filter(type='promo').count(), 40)
+
+    def test_same_viewer_redeems_once(self):
+        outcomes = self._hammer([self.wallets[0]] * 20)
+
+        self.assertEqual(outcomes.count("redeemed"), 1)
+        self.assertEqual(outcomes.count("Ви вже використали цей промокод."), 19)
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.used_count, 1)
+        self.wallets[0].refresh_from_db()
+        self.assertEqual(self.wallets[0].balance, 50)
+
+    def test_redemption_is_a_handful_of_queries(self):
+        # промокод, BEGIN, used_by, used_count, баланс, історія, COMMIT
+        with self.assertNumQueries(7):
+            redeem_promo(self.wallets[0], "HYPE")
+        PromoCode.objects.filter(pk=self.promo.pk).update(is_active=False)
+        with self.assertRaisesMessage(PromoRejected, "Промокод неактивний."):
+            redeem_promo(self.wallets[1], "HYPE")
+        with self.assertRaisesMessage(PromoRejected, "Такого промокоду не існує."):
+            redeem_promo(self.wallets[1], "NOPE")
+        self.assertEqual(self.promo.used_by.count(), 1)
+
+    def test_credit_failure_is_not_reported_as_repeat_redemption(self):
+        from django.db import IntegrityError
+        with mock.patch('schedule.ledger.credit', side_effect=IntegrityError("wallet")), \
+                self.assertRaises(IntegrityError):
+            redeem_promo(self.wallets[0], "HYPE")
+        self.assertEqual(self.promo.used_by.count(), 0)
+        redeem_promo(self.wallets[0], "HYPE")
+
+
+class StartupTests(TestCase):
+    def test_worker_boot_does_not_load_ml_stack(self):
+        from .management.commands.startup_report import SCENARIOS, run_scenario
+        result = run_scenario(SCENARIOS["worker"])
+        self.assertEqual(result["heavy_modules"], [])
+
+
+@override_settings(RECOMMENDATION_WORKERS=0)
+class SimilarMoviesTests(TestCase):
+    def setUp(self):
+        from .recommendations import _tfidf_cache
+        _tfidf_cache["index"] = None
+        user = CustomUser.objects.create_user(email="viewer@example.com", password="pass")
+        Viewer.objects.create(user=user, first_name="Test")
+        self.client.force_login(user)
+
+        action = Genre.objects.create(name="Action")
+        self.seed = Movie.objects.create(title="Seed", release_year=2020, full_description="robots fight aliens")
+        self.close = Movie.objects.create(title="Close", release_year=2021, full_description="aliens fight robots")
+        self.far = Movie.objects.create(title="Far", release_year=2019, full_description="wedding in a village")
+        self.seed.genres.add(action)
+        self.close.genres.add(action)
+        call_command('build_movie_neighbours', stdout=open(os.devnull, 'w'))
+
+    def test_endpoint_reads_neighbour_table(self):
+        url = reverse('similar_movies', args=[self.seed.id])
+        self.client.get(url)
+        with self.assertNumQueries(3):  # сесія, користувач, сусіди
+            data = self.client.get(url).json()
+        self.assertEqual([m['title'] for m in data['movies']], ["Close"])
+
+        for limit in ("-3", "0", "abc", "1000"):
+            response = self.client.get(url, {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['movies']), 1)
+
+    def test_incremental_refresh_keeps_table_k(self):
+        from .recommendations import refresh_movie_neighbours
+        from .signals import record_catalog_change
+        with self.captureOnCommitCallbacks(execute=True):
+            twin = Movie.objects.create(title="Twin", release_year=2022, full_description="aliens at war with robots")
+            twin.genres.add(Genre.objects.get(name="Action"))
+            self.far.genres.add(Genre.objects.get(name="Action"))
+        call_command('build_movie_neighbours', k=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.seed.neighbours.count(), 2)
+
+        # поріг і довжина списків — за таблицею, а не за аргументом
+        Movie.objects.filter(pk=self.far.pk).update(full_description="robots fight aliens")
+        record_catalog_change(self.far.id)
+        refresh_movie_neighbours([self.far.id], k=1)
+        self.assertIn(self.far.id, self.seed.neighbours.values_list('neighbour_id', flat=True))
+        self.assertEqual(self.seed.neighbours.count(), 2)
+
+    def test_catalog_edit_goes_through_the_pool(self):
+        from . import recommender
+        with self.settings(RECOMMENDATION_WORKERS=2), \
+                mock.patch.object(recommender, '_get_executor') as executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.far.save()
+        executor.return_value.submit.assert_called_once_with(recommender._refresh_neighbours, [self.far.id], ())
+
+    def test_edit_updates_affected_lists(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.full_description = "robots fight aliens"
+            self.far.save()
+
+        self.assertIn(self.far.id, self.seed.neighbours.values_list('neighbour_id', flat=True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.close.delete()
+        self.assertEqual(list(self.seed.neighbours.values_list('neighbour_id', flat=True)), [self.far.id])
@@ -0,0 +1,106 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MovieActivity, MovieTrend, Rating
+
+
+# ============================================================
+# === Популярное сейчас: счётчики с затуханием ===============
+# ============================================================
+# Forward decay: событие в момент t весит weight · 2^((t − EPOCH) / HALF_LIFE).
+# Все накопленные очки растут с одной скоростью, поэтому порядок фильмов
+# по MovieTrend.score совпадает с порядком по честно затухшему счётчику,
+# а новое событие — это один атомарный UPDATE score = score + w, без
+# чтения строки и без пересчёта остальных фильмов. Реальное значение на
+# момент now — score · 2^(−(now − EPOCH) / HALF_LIFE). При полураспаде
+# в неделю float переполнится лишь через ~20 лет после эпохи.
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+TRENDING_HALF_LIFE = timedelta(days=7)
+
+# Вес событий: оценка и покупка онлайн-доступа значат больше визита
+EVENT_WEIGHTS = {
+    "activity": 1.0,
+    "rating": 2.0,
+    "online": 5.0,
+}
+
+# Готовый список для новых зрителей лежит в кэше; manage.py
+# refresh_trending (по расписанию) пересчитывает его заранее, а TTL —
+# страховка, если планировщик не работает.
+TRENDING_KEY = "recommendations:trending"
+TRENDING_SIZE = 100
+TRENDING_TTL = 60 * 15
+
+
+def _growth(when):
+    return 2.0 ** ((when - TRENDING_EPOCH) / TRENDING_HALF_LIFE)
+
+
+def activity_weight(time_spent, watched_trailer, watched_movie):
+    """Те же баллы, что и у персональной активности в рекомендациях."""
+    return min(min(time_spent / 300, 1.0) * 0.6 + watched_trailer * 0.25 + watched_movie * 0.15, 1.0)
+
+
+def record_event(movie_id, kind, weight=1.0, when=None):
+    amount = EVENT_WEIGHTS[kind] * weight * _growth(when or timezone.now())
+    if amount <= 0:
+        return
+    updated = MovieTrend.objects.filter(movie_id=movie_id).update(
+        score=F('score') + amount, updated_at=timezone.now()
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            MovieTrend.objects.create(movie_id=movie_id, score=amount)
+    except IntegrityError:
+        # строку успел создать параллельный запрос
+        MovieTrend.objects.filter(movie_id=movie_id).update(score=F('score') + amount)
+
+
+def refresh_trending(size=TRENDING_SIZE):
+    """Пересчитывает готовый список [(id фильма, очки на сейчас)]."""
+    decay = 1.0 / _growth(timezone.now())
+    trending = [
+        (movie_id, score * decay)
+        for movie_id, score in
+        MovieTrend.objects.filter(score__gt=0).order_by('-score').values_list('movie_id', 'score')[:size]
+    ]
+    cache.set(TRENDING_KEY, trending, TRENDING_TTL)
+    return trending
+
+
+def trending_movies():
+    """Список для холодного старта: из кэша, без расчёта на запрос."""
+    trending = cache.get(TRENDING_KEY)
+    if trending is None:
+        trending = refresh_trending()
+    return trending
+
+
+def rebuild_trending(size=TRENDING_SIZE):
+    """
+    Собирает счётчики заново из истории MovieActivity и Rating — для
+    первого запуска и если инкрементальные обновления где-то терялись.
+    """
+    totals = defaultdict(float)
+    activities = MovieActivity.objects.values_list(
+        'movie_id', 'time_spent', 'watched_trailer', 'watched_movie', 'last_visit'
+    )
+    for movie_id, spent, trailer, movie, when in activities.iterator():
+        totals[movie_id] += EVENT_WEIGHTS["activity"] * activity_weight(spent, trailer, movie) * _growth(when)
+    for movie_id, score, when in Rating.objects.values_list('movie_id', 'score', 'created_at').iterator():
+        totals[movie_id] += EVENT_WEIGHTS["rating"] * score / 10 * _growth(when)
+
+    with transaction.atomic():
+        MovieTrend.objects.all().delete()
+        MovieTrend.objects.bulk_create(
+            [MovieTrend(movie_id=movie_id, score=score) for movie_id, score in totals.items() if score > 0],
+            batch_size=1000,
+        )
+    return refresh_trending(size)
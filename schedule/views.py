@@ -1,12 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.http import require_http_methods, require_POST, require_GET
+from django.urls import reverse
+from django.views.decorators.http import condition, require_http_methods, require_POST, require_GET
+from django.views.decorators.cache import cache_control
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponseForbidden, JsonResponse
+from django.http import Http404, HttpResponseForbidden, JsonResponse
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q, Count
 from django.contrib import messages
 from django.utils import timezone
@@ -17,7 +19,16 @@ from decimal import Decimal
 
 from .models import *
 from .forms import CustomUserCreationForm, AvatarUpdateForm
-from .recommendations import hybrid_recommendations
+from .ledger import InsufficientFunds, PromoRejected, credit, debit, redeem_promo
+from .seating import (
+    GROUP_MAX_SEATS, SEAT_HOLD_TTL, HoldsBusy, SeatHeld, SeatMap, SeatTaken, active_holds,
+    buy_ticket, buy_tickets, hold_seats, holds_signature, pick_seats, release_holds, seat_map_payload,
+    seat_map_version, sell_seat,
+)
+from .trending import activity_weight, record_event
+from .recommender import (
+    SIMILAR_MOVIES_K, cached_recommendations, invalidate_recommendations, recommendations_snapshot
+)
 
 
 def register(request):
@@ -68,72 +79,150 @@ def logout_view(request):
 @login_required(login_url='login')
 def movie_list(request):
     viewer = request.user.viewer
-    movies = Movie.objects.all()
-
-    recommendations = hybrid_recommendations(viewer, limit=5)
+    # жанри всіх фільмів одним запитом для {{ movie.genres.all }} у шаблоні
+    movies = Movie.objects.prefetch_related('genres')
 
+    # рекомендації підвантажуються окремо через api/recommendations/,
+    # щоб розрахунок не затримував сторінку каталогу
     return render(request, 'movie_list.html', {
         'movies': movies,
-        'recommendations': recommendations,
         'viewer': viewer
     })
 
 
+@login_required
+@require_GET
+def recommendations_api(request):
+    """Блок «Рекомендовано для вас»: готовий список одразу, перерахунок — у фоні."""
+    viewer = request.user.viewer
+    if settings.DEBUG and request.GET.get('sync'):
+        # для налагодження: рахуємо тут же, щоб етапи потрапили в Server-Timing
+        movies, pending = cached_recommendations(viewer, limit=5), False
+    else:
+        movies, pending = recommendations_snapshot(viewer, limit=5)
+    movies = movies or []
+
+    genres = {}
+    for movie_id, name in Movie.genres.through.objects \
+            .filter(movie_id__in=[m.id for m in movies]) \
+            .values_list('movie_id', 'genre__name'):
+        genres.setdefault(movie_id, []).append(name)
+
+    data = [{
+        'id': movie.id,
+        'title': movie.title,
+        'year': movie.release_year,
+        'short_description': movie.short_description,
+        'genres': genres.get(movie.id, []),
+        'image': movie.image.url if movie.image else None,
+        'url': reverse('film_description', args=[movie.id]),
+    } for movie in movies]
+    return JsonResponse({'ok': True, 'pending': pending, 'movies': data})
+
+
 def home(request):
     return render(request, 'home.html')
 
 
 def session_list(request, movie_id):
     movie = get_object_or_404(Movie, id=movie_id)
-    sessions = Session.objects.filter(movie=movie)
+    # доступність — з лічильників сеансу, без COUNT по Seat і без залу
+    sessions = Session.objects.filter(movie=movie).defer('seat_map')
     return render(request, 'session_list.html', {'movie': movie, 'sessions': sessions})
 
 
+def _seat_from_request(data, seat_map):
+    """(row, column) з POST/GET; Http404, якщо такого місця в залі немає."""
+    try:
+        row, column = int(data.get('row')), int(data.get('column'))
+    except (TypeError, ValueError):
+        raise Http404("Невідоме місце")
+    if not seat_map.contains(row, column):
+        raise Http404("Невідоме місце")
+    return row, column
+
+
 @login_required
 def seat_selection(request, session_id):
-    session = get_object_or_404(Session, id=session_id)
-    seats = session.seats.all().order_by('row', 'column')
-
-    seat_rows = []
-    current_row = []
-    last_row = None
-    for seat in seats:
-        if last_row is None or seat.row != last_row:
-            if current_row:
-                seat_rows.append(current_row)
-            current_row = []
-            last_row = seat.row
-        current_row.append(seat)
-    if current_row:
-        seat_rows.append(current_row)
+    session = get_object_or_404(Session.objects.select_related('movie', 'hall'), id=session_id)
+    seat_map = SeatMap.for_session(session)
 
     if request.method == 'POST':
-        seat_id = request.POST.get('seat_id')
-        seat = get_object_or_404(Seat, id=seat_id)
+        row, column = _seat_from_request(request.POST, seat_map)
 
         if not hasattr(request.user, 'viewer'):
             return HttpResponseForbidden("Ви повинні бути глядачем")
 
         viewer = request.user.viewer
 
-        if seat.is_reserved:
-            return redirect('viewer_sessions', viewer_id=seat.viewer.id)
-
         if Seat.objects.filter(session=session, viewer=viewer).exists():
             return redirect('viewer_sessions', viewer_id=viewer.id)
 
-        seat.is_reserved = True
-        seat.viewer = viewer
-        seat.save()
+        try:
+            sell_seat(session, row, column, viewer)
+        except SeatHeld:
+            messages.error(request, "Це місце зараз оформлює інший глядач.")
+            return redirect('seat_selection', session_id=session.id)
+        except SeatTaken:
+            # місце могли вже повернути, а квиток — купити без прив'язки до глядача
+            owner = Seat.objects.filter(session=session, row=row, column=column).first()
+            if owner is None or owner.viewer_id is None:
+                messages.error(request, "Це місце вже зайняте.")
+                return redirect('seat_selection', session_id=session.id)
+            return redirect('viewer_sessions', viewer_id=owner.viewer_id)
 
         return redirect('reservation')
 
+    # у таблиці лише продані місця — одним запитом, щоб показати власників
+    owners = {
+        (row, column): viewer_id
+        for row, column, viewer_id in session.seats.values_list('row', 'column', 'viewer_id')
+    }
+    held = active_holds(session.id)
+    seat_rows = [
+        [
+            {
+                'row': row, 'column': column, 'is_reserved': taken,
+                'is_held': not taken and (row, column) in held, 'viewer_id': owners.get((row, column)),
+            }
+            for column, taken in seats
+        ]
+        for row, seats in enumerate(seat_map.grid(), start=1)
+    ]
+
     return render(request, 'seat_selection.html', {
         'session': session,
         'seat_rows': seat_rows
     })
 
 
+def _seat_map_etag(request, session_id):
+    version = seat_map_version(session_id)
+    if version is None:
+        return None
+    # версію й утримання (спільний кеш) view бере звідси, а не читає вдруге
+    request.seat_map_state = (version, active_holds(session_id))
+    return f'"seats-{session_id}-{version}-{holds_signature(request.seat_map_state[1])}"'
+
+
+@require_GET
+@cache_control(no_cache=True)
+@condition(etag_func=_seat_map_etag)
+def session_seats(request, session_id):
+    """
+    Карта місць сеансу: рядок доступності row-major ('0' вільно, '1' продано,
+    '2' утримується на оплаті) і кількість проданих. ETag = версія карти й відбиток утримань, тож
+    опитування без змін отримує 304 за два читання: версії з БД і утримань зі спільного кешу.
+
+    Публічна навмисно, як і розклад: лише зайнятість місць, без власників
+    квитків — її можна показати ще до входу.
+    """
+    payload = seat_map_payload(session_id, *getattr(request, 'seat_map_state', ()))
+    if payload is None:
+        raise Http404("Сеанс не знайдено")
+    return JsonResponse({'ok': True, **payload})
+
+
 @login_required
 def reservation(request):
     return render(request, 'reservation.html')
@@ -311,6 +400,7 @@ def add_bookmark(request, movie_id):
 
     if status == 'nothing':
         Bookmark.objects.filter(viewer=viewer, movie=movie).delete()
+        invalidate_recommendations(viewer)
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({
                 'ok': True,
@@ -328,6 +418,7 @@ def add_bookmark(request, movie_id):
     bookmark, created = Bookmark.objects.update_or_create(
         viewer=viewer, movie=movie, defaults={'status': status}
     )
+    invalidate_recommendations(viewer)
 
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({
@@ -357,9 +448,14 @@ def rate_movie(request, movie_id):
             return JsonResponse({'ok': False, 'error': 'Оцінка повинна бути від 1 до 10'}, status=400)
         return redirect('film_description', movie_id=movie.id)
 
-    Rating.objects.update_or_create(
+    _, created = Rating.objects.update_or_create(
         viewer=viewer, movie=movie, defaults={'score': score}
     )
+    invalidate_recommendations(viewer)
+    if created:
+        # у тренді оцінка — одна подія на глядача, як і в rebuild_trending;
+        # переоцінка не додає фільму очок
+        record_event(movie.id, 'rating', weight=score / 10)
 
     avg = movie.ratings.aggregate(models.Avg('score'))['score__avg']
     avg_rating = round(avg, 1) if avg else None
@@ -645,13 +741,38 @@ def global_chat_send(request):
 
 @login_required
 def test_recommendations(request, movie_id):
-    viewer = request.user.viewer
     movie = get_object_or_404(Movie, id=movie_id)
-    recs = hybrid_recommendations(viewer, movie)
-    titles = [m.title for m in recs]
+    titles = [n.neighbour.title for n in movie.neighbours.select_related('neighbour')]
     return JsonResponse({'ok': True, 'recommendations': titles})
 
 
+@login_required
+@require_GET
+def similar_movies(request, movie_id):
+    """Схожі фільми з готової таблиці MovieNeighbour — один запит, O(K)."""
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 6)), SIMILAR_MOVIES_K))
+    except ValueError:
+        limit = 6
+
+    neighbours = MovieNeighbour.objects.filter(movie_id=movie_id) \
+        .select_related('neighbour') \
+        .order_by('rank')[:limit]
+
+    data = []
+    for n in neighbours:
+        movie = n.neighbour
+        data.append({
+            'id': movie.id,
+            'title': movie.title,
+            'year': movie.release_year,
+            'image': movie.image.url if movie.image else None,
+            'url': reverse('film_description', args=[movie.id]),
+            'score': round(n.score, 3),
+        })
+    return JsonResponse({'ok': True, 'movies': data})
+
+
 @csrf_exempt
 @login_required
 @require_POST
@@ -669,6 +790,8 @@ def track_activity(request, movie_id):
     act.watched_trailer = act.watched_trailer or watched_trailer
     act.watched_movie = act.watched_movie or watched_movie
     act.save(update_fields=['time_spent', 'watched_trailer', 'watched_movie', 'last_visit'])
+    invalidate_recommendations(viewer)
+    record_event(movie.id, 'activity', weight=activity_weight(time_spent, watched_trailer, watched_movie))
 
     return JsonResponse({'ok': True})
 
@@ -682,30 +805,12 @@ def wallet_page(request):
     if request.method == 'POST':
         code_input = request.POST.get('code', '').strip().upper()
 
-        promo = PromoCode.objects.filter(code__iexact=code_input).first()
-        if not promo:
-            messages.error(request, "Такого промокоду не існує.")
-            return redirect('wallet')
-
-        valid, error = promo.is_valid_for(viewer)
-        if not valid:
-            messages.error(request, error)
+        try:
+            promo = redeem_promo(wallet, code_input)
+        except PromoRejected as e:
+            messages.error(request, str(e))
             return redirect('wallet')
 
-        wallet.balance += promo.amount
-        wallet.save(update_fields=['balance'])
-
-        promo.used_by.add(viewer)
-        promo.used_count += 1
-        promo.save(update_fields=['used_count'])
-
-        Transaction.objects.create(
-            wallet=wallet,
-            type='promo',
-            amount=promo.amount,
-            description=f"Поповнення промокодом {promo.code}"
-        )
-
         messages.success(request, f"Баланс поповнено на {promo.amount}₴!")
         return redirect('wallet')
 
@@ -733,15 +838,7 @@ def wallet_deposit(request):
             messages.error(request, "Ця сума недоступна для поповнення.")
             return redirect('wallet_deposit')
 
-        wallet.balance += amount
-        wallet.save(update_fields=['balance'])
-
-        Transaction.objects.create(
-            wallet=wallet,
-            type='deposit',
-            amount=amount,
-            description=f"Поповнення балансу на {amount}₴"
-        )
+        credit(wallet, amount, 'deposit', f"Поповнення балансу на {amount}₴")
 
         messages.success(request, f"Баланс успішно поповнено на {amount}₴!")
         return redirect('wallet')
@@ -764,23 +861,24 @@ def confirm_online(request, movie_id):
         return redirect('film_description', movie_id=movie.id)
 
     if request.method == 'POST':
-        if wallet.balance < ONLINE_PRICE:
+        try:
+            with transaction.atomic():
+                activity, _ = MovieActivity.objects.get_or_create(viewer=viewer, movie=movie)
+                # перевірка вище — лише для сторінки; тут умовний UPDATE блокує
+                # рядок, тож із двох одночасних покупок доступ (і списання) буде одне
+                granted = MovieActivity.objects.filter(pk=activity.pk, watched_movie=False).update(
+                    watched_movie=True
+                )
+                if granted:
+                    debit(wallet, ONLINE_PRICE, f"Покупка онлайн-доступу до '{movie.title}'")
+        except InsufficientFunds:
             messages.error(request, "Недостатньо коштів 💸.")
             return redirect('wallet_deposit')
-
-        wallet.balance -= ONLINE_PRICE
-        wallet.save(update_fields=['balance'])
-        Transaction.objects.create(
-            wallet=wallet,
-            type='spend',
-            amount=ONLINE_PRICE,
-            description=f"Покупка онлайн-доступу до '{movie.title}'"
-        )
-
-        MovieActivity.objects.update_or_create(
-            viewer=viewer, movie=movie,
-            defaults={'watched_movie': True}
-        )
+        if not granted:
+            messages.info(request, "Ви вже маєте доступ до онлайн-перегляду 🎬")
+            return redirect('film_description', movie_id=movie.id)
+        invalidate_recommendations(viewer)
+        record_event(movie.id, 'online')
 
         messages.success(request, f"Доступ до онлайн-перегляду '{movie.title}' надано 🎥")
         return redirect('film_description', movie_id=movie.id)
@@ -794,44 +892,171 @@ def confirm_online(request, movie_id):
 
 
 @login_required
-def confirm_ticket(request, seat_id):
-    seat = get_object_or_404(Seat, id=seat_id)
-    session = seat.session
+def confirm_ticket(request, session_id, row, column):
+    session = get_object_or_404(Session.objects.select_related('movie', 'hall'), id=session_id)
+    seat_map = SeatMap.for_session(session)
+    if not seat_map.contains(row, column):
+        raise Http404("Невідоме місце")
+    seat = Seat(session=session, row=row, column=column)
     viewer = request.user.viewer
     wallet, _ = Wallet.objects.get_or_create(viewer=viewer)
 
-    ticket_price = Decimal(str(session.price))
-
-    if seat.is_reserved:
+    if seat_map.is_taken(row, column):
         messages.error(request, "Це місце вже зайняте.")
         return redirect('seat_selection', session_id=session.id)
 
     if request.method == 'POST':
-        if wallet.balance < ticket_price:
+        try:
+            buy_ticket(session, row, column, wallet)
+        except SeatHeld:
+            messages.error(request, "Це місце зараз оформлює інший глядач. Спробуйте за кілька хвилин.")
+            return redirect('seat_selection', session_id=session.id)
+        except SeatTaken:
+            messages.error(request, "Це місце вже зайняте.")
+            return redirect('seat_selection', session_id=session.id)
+        except InsufficientFunds:
             messages.error(request, "Недостатньо коштів 💸. Поповніть баланс.")
             return redirect('wallet_deposit')
 
-        wallet.balance -= ticket_price
-        wallet.save(update_fields=['balance'])
-
-        Transaction.objects.create(
-            wallet=wallet,
-            type='spend',
-            amount=ticket_price,
-            description=f"Покупка квитка на '{session.movie.title}' (ряд {seat.row}, місце {seat.column})"
-        )
-
-        seat.is_reserved = True
-        seat.viewer = viewer
-        seat.save(update_fields=['is_reserved', 'viewer'])
-
         messages.success(request, "Квиток успішно придбано! 🎟")
         return redirect('reservation')
 
+    # місце тримається за глядачем, поки він на сторінці оплати
+    try:
+        hold_seats(session.id, [(row, column)], viewer.id)
+    except SeatHeld:
+        messages.error(request, "Це місце зараз оформлює інший глядач. Спробуйте за кілька хвилин.")
+        return redirect('seat_selection', session_id=session.id)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('seat_selection', session_id=session.id)
+
     return render(request, 'confirm_ticket.html', {
         'seat': seat,
         'session': session,
         'movie': session.movie,
         'viewer': viewer,
         'wallet': wallet,
+        'hold_ttl': SEAT_HOLD_TTL,
+    })
+
+
+def _seats_from_request(data):
+    """[(row, column), ...] з seats=3-7&seats=3-8; None — список некоректний."""
+    try:
+        seats = [tuple(int(part) for part in seat.split('-', 1)) for seat in data.getlist('seats')]
+    except ValueError:
+        return None
+    if any(len(seat) != 2 for seat in seats):
+        return None
+    return seats
+
+
+def _seats_conflict(error):
+    seats = [f"{row}-{column}" for row, column in (error.args[0] if error.args else [])]
+    if isinstance(error, SeatHeld):
+        return JsonResponse({'ok': False, 'error': 'held', 'held': seats}, status=409)
+    return JsonResponse({'ok': False, 'error': 'taken', 'taken': seats}, status=409)
+
+
+@login_required
+@require_POST
+def hold_session_seats(request, session_id):
+    """
+    Утримує вибрані місця (seats=3-7&seats=3-8) на SEAT_HOLD_TTL секунд.
+    Лише кеш, без запису в БД; повторний виклик подовжує утримання.
+    """
+    session = get_object_or_404(Session.objects.select_related('hall'), id=session_id)
+    seats = _seats_from_request(request.POST)
+    if not seats or len(seats) > GROUP_MAX_SEATS:
+        return JsonResponse({'ok': False, 'error': 'Некоректний список місць'}, status=400)
+    seat_map = SeatMap.for_session(session)
+    if not all(seat_map.contains(row, column) for row, column in seats):
+        return JsonResponse({'ok': False, 'error': 'Некоректний список місць'}, status=400)
+    taken = [(row, column) for row, column in seats if seat_map.is_taken(row, column)]
+    if taken:
+        return _seats_conflict(SeatTaken(taken))
+    try:
+        hold_seats(session.id, seats, request.user.viewer.id)
+    except SeatHeld as e:
+        return _seats_conflict(e)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    return JsonResponse({'ok': True, 'seats': [f"{row}-{column}" for row, column in seats], 'expires_in': SEAT_HOLD_TTL})
+
+
+AUTO_PICK_ATTEMPTS = 3
+
+
+@login_required
+@require_POST
+def auto_pick_seats(request, session_id):
+    """
+    Автовибір count місць поруч (ближче до центру залу) і утримання їх
+    за глядачем — далі їх можна купити через book_seats.
+    """
+    session = get_object_or_404(Session.objects.select_related('hall'), id=session_id)
+    try:
+        count = int(request.POST.get('count', 1))
+    except ValueError:
+        count = 0
+    if not 1 <= count <= GROUP_MAX_SEATS:
+        return JsonResponse({'ok': False, 'error': f'Можна вибрати від 1 до {GROUP_MAX_SEATS} місць'}, status=400)
+
+    viewer_id = request.user.viewer.id
+    # між вибором і утриманням блок може перехопити інший глядач — шукаємо ще раз
+    for _ in range(AUTO_PICK_ATTEMPTS):
+        seats = pick_seats(session, count, viewer_id)
+        if seats is None:
+            return JsonResponse({'ok': False, 'error': 'Немає стількох вільних місць поруч'}, status=409)
+        try:
+            # новий блок замінює попередній вибір глядача
+            hold_seats(session.id, seats, viewer_id, replace=True)
+        except SeatHeld:
+            continue
+        return JsonResponse({
+            'ok': True,
+            'seats': [f"{row}-{column}" for row, column in seats],
+            'expires_in': SEAT_HOLD_TTL,
+        })
+    return JsonResponse({'ok': False, 'error': 'Місця швидко розбирають, спробуйте ще раз'}, status=409)
+
+
+@login_required
+@require_POST
+def release_session_seats(request, session_id):
+    """Покинута оплата: звільняє всі утримання глядача на сеансі."""
+    try:
+        released = release_holds(session_id, request.user.viewer.id)
+    except HoldsBusy:
+        return JsonResponse({'ok': False, 'error': 'held'}, status=409)
+    return JsonResponse({'ok': True, 'released': released})
+
+
+@login_required
+@require_POST
+def book_seats(request, session_id):
+    """
+    Групова покупка: seats=3-7&seats=3-8 — усі місця або жодного, одне
+    списання з гаманця і один запис в історії з позиціями.
+    """
+    session = get_object_or_404(Session.objects.select_related('movie', 'hall'), id=session_id)
+    seats = _seats_from_request(request.POST)
+    if seats is None:
+        return JsonResponse({'ok': False, 'error': 'Некоректний список місць'}, status=400)
+
+    wallet, _ = Wallet.objects.get_or_create(viewer=request.user.viewer)
+    try:
+        claimed = buy_tickets(session, seats, wallet)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    except SeatTaken as e:
+        return _seats_conflict(e)
+    except InsufficientFunds:
+        return JsonResponse({'ok': False, 'error': 'Недостатньо коштів'}, status=402)
+
+    return JsonResponse({
+        'ok': True,
+        'seats': [f"{seat.row}-{seat.column}" for seat in claimed],
+        'total': str(session.price * len(claimed)),
     })
@@ -32,6 +32,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # у DEBUG додає заголовок Server-Timing з етапами розрахунку рекомендацій
+    'schedule.profiling.RecommendationTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'school_project.urls'
@@ -58,9 +60,63 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # паралельні покупки чекають на блокування запису, а не падають одразу
+        'OPTIONS': {'timeout': 30},
+        # тестова БД у файлі: спільна БД у пам'яті не чекає на блокування,
+        # а навантажувальні тести продажу квитків пишуть з багатьох потоків
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Кеш за замовчуванням — спільний для всіх воркерів gunicorn: у ньому
+# утримання місць (cache.add має бути атомарним між процесами) і карти
+# місць сеансів. Без REDIS_URL — таблиця в БД (manage.py migrate створює
+# її сама); з REDIS_URL — Redis (потрібен пакет redis).
+if os.environ.get('REDIS_URL'):
+    DEFAULT_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+else:
+    DEFAULT_CACHE = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cinema_cache',
+        # за замовчуванням лише 300 записів, і чистка видаляла б живі утримання
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    }
+
+CACHES = {
+    'default': DEFAULT_CACHE,
+    # Готові рекомендації глядачів: LRU на MAX_ENTRIES записів + TTL
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': 60 * 30,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Схожість описів для рекомендацій: 'exact' — повна матриця n×n,
+# 'approximate' — LSH-індекс для великих каталогів (manage.py ann_report)
+RECOMMENDATION_SIMILARITY_MODE = 'exact'
+
+# Скільки схожих фільмів зберігається для кожного фільму (MovieNeighbour)
+RECOMMENDATION_SIMILAR_MOVIES_K = 20
+
+# Фоновий перерахунок рекомендацій для api/recommendations/ і таблиці
+# схожих фільмів: кількість потоків (0 — рахувати одразу, без пулу)
+# і скільки глядачів може чекати в черзі
+RECOMMENDATION_WORKERS = 2
+RECOMMENDATION_QUEUE_SIZE = 100
+
+# Куди передаються поетапні заміри hybrid_recommendations (час і
+# кількість SQL-запитів): лог, перцентилі за ковзним вікном, заголовки
+RECOMMENDATION_TIMING_HOOKS = [
+    'schedule.profiling.log_timings',
+    'schedule.profiling.record_percentiles',
+    'schedule.profiling.collect_for_response',
+]
+
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
 ]
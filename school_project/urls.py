@@ -11,8 +11,14 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('register/', views.register, name='register'),
     path('movies/', views.movie_list, name='movie_list'),
+    path('api/recommendations/', views.recommendations_api, name='recommendations_api'),
     path('sessions/<int:movie_id>/', views.session_list, name='session_list'),
     path('seats/<int:session_id>/', views.seat_selection, name='seat_selection'),
+    path('api/session/<int:session_id>/seats/', views.session_seats, name='session_seats'),
+    path('api/session/<int:session_id>/hold/', views.hold_session_seats, name='hold_session_seats'),
+    path('api/session/<int:session_id>/release/', views.release_session_seats, name='release_session_seats'),
+    path('api/session/<int:session_id>/auto-pick/', views.auto_pick_seats, name='auto_pick_seats'),
+    path('api/session/<int:session_id>/book/', views.book_seats, name='book_seats'),
     path('reservation/', views.reservation, name='reservation'),
     path('profile/<int:viewer_id>/', views.profile, name='profile'),
 
@@ -31,6 +37,7 @@ urlpatterns = [
     path('random_movie/', views.random_movie, name='random_movie'),
     path('movie/<int:movie_id>/bookmark/', views.add_bookmark, name='add_bookmark'),
     path('movie/<int:movie_id>/rate/', views.rate_movie, name='rate_movie'),
+    path('api/movie/<int:movie_id>/similar/', views.similar_movies, name='similar_movies'),
 
     # FRIENDS
     path('friends/', views.friends_page, name='friends'),
@@ -58,7 +65,7 @@ urlpatterns = [
     path('api/track_activity/<int:movie_id>/', views.track_activity, name='track_activity'),
     path('wallet/', views.wallet_page, name='wallet'),
     path('wallet/deposit/', views.wallet_deposit, name='wallet_deposit'),
-    path('confirm/ticket/<int:seat_id>/', views.confirm_ticket, name='confirm_ticket'),
+    path('confirm/ticket/<int:session_id>/<int:row>/<int:column>/', views.confirm_ticket, name='confirm_ticket'),
     path('confirm/online/<int:movie_id>/', views.confirm_online, name='confirm_online'),
 ]
 